@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# =============================================================================
+# Created By  : Roger Wang
+# Created Date: 3/1/2022
+# =============================================================================
+
+"""
+A benchmark of the time it takes to import the modules of simplerpy, and of
+the R startup that is deferred until the first R-backed call. Every
+measurement runs in a fresh interpreter, run from the root of the repo with
+    python benchmarks/bench_import.py
+"""
+
+import statistics
+import subprocess
+import sys
+
+REPEAT = 5
+
+IMPORT = '''
+import sys, time
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start, 'rpy2.robjects' in sys.modules)
+'''
+
+START_R = '''
+import time
+from simplerpy._session import R
+start = time.perf_counter()
+R.start()
+print(time.perf_counter() - start, True)
+'''
+
+
+def measure(code):
+    """
+    Runs the code in fresh interpreters and returns the median of the time
+    it prints, and whether R was loaded.
+    """
+    times = []
+    for _ in range(REPEAT):
+        out = subprocess.run([sys.executable, '-c', code], check=True,
+                             capture_output=True, text=True).stdout.split()
+        times.append(float(out[0]))
+    return statistics.median(times), out[1] == 'True'
+
+
+if __name__ == '__main__':
+    for module in ('simplerpy.linear_model', 'simplerpy.aov',
+                   'simplerpy.t_test'):
+        seconds, loaded = measure(IMPORT.format(module=module))
+        print(f'import {module:<24}{seconds * 1000:9.1f} ms   '
+              f'R loaded: {loaded}')
+    try:
+        seconds, _ = measure(START_R)
+        print(f'{"first R-backed call (R startup)":<31}'
+              f'{seconds * 1000:9.1f} ms')
+    except subprocess.CalledProcessError:
+        print('R startup could not be measured, is rpy2 installed?')
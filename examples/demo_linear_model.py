@@ -65,4 +65,13 @@ X = X.to_numpy() # convert pandas series to numpy arrays
 y = y.to_numpy()
 X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.33, random_state=42)
 model3.fit(X_train, y_train)
-model3.summary()
\ No newline at end of file
+model3.summary()
+
+# Fit a model chunk by chunk, i.e. from pd.read_csv(path, chunksize=8),
+# without holding the whole table in memory
+model4 = LM()
+for start in range(0, len(df), 8):
+    chunk = df.iloc[start:start + 8]
+    model4.partial_fit(chunk.drop(columns=['Stock_Index_Price']), chunk['Stock_Index_Price'])
+model4.finalize()
+print(f'Coefficients fitted from chunks are: {model4.coefficient()}')
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Helpers to absorb fixed effects of factors with many levels, i.e. a customer
+or store id, from a linear model without building their dummy columns: the
+data is demeaned within the levels of every factor (the within
+transformation), and the degrees of freedom the effects take are counted.
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+
+from simplerpy._ols import anova, qr_solve, readonly, summarize
+
+
+def group_codes(data, absorb):
+    """
+    Returns the integer codes of the levels of the factors to absorb.
+
+    :param data: Pandas DataFrame or dict mapping names to array-like columns
+    :param absorb: list of the names of the factors
+    :return: a list of arrays (n_samples,) of codes from 0
+    """
+    groups = []
+    for name in absorb:
+        try:
+            codes, _ = pd.factorize(np.asarray(data[name]))
+        except KeyError:
+            raise ValueError(f'variable {name} not found in data')
+        if np.any(codes < 0):
+            raise ValueError(f'missing values in {name}')
+        groups.append(codes)
+    return groups
+
+
+def absorbed_df(groups):
+    """
+    Counts the degrees of freedom taken by the fixed effects of the factors,
+    intercept included. With two factors the levels are only identified up
+    to one constant per connected component of the graph linking the levels
+    observed together; every further factor is counted with one redundant
+    level, an upper bound like lfe in R.
+
+    :param groups: list of arrays of level codes
+    :return: an integer
+    """
+    levels = [int(codes.max()) + 1 for codes in groups]
+    df = sum(levels)
+    if len(groups) >= 2:
+        n = len(groups[0])
+        links = sparse.coo_matrix((np.ones(n), (groups[0], groups[1])),
+                                  shape=(levels[0], levels[1]))
+        # the levels of the two factors are the nodes of a bipartite graph
+        graph = sparse.bmat([[None, links], [links.T, None]])
+        df -= connected_components(graph, directed=False)[0]
+    return df - max(len(groups) - 2, 0)
+
+
+def demean(Z, groups, tol=1e-8, max_iter=10000):
+    """
+    Subtracts from the columns their means within the levels of every
+    factor, repeating the passes over the factors (alternating projections)
+    until the means vanish when there are several factors.
+
+    :param Z: array (n_samples, n_columns)
+    :param groups: list of arrays of level codes
+    :param tol: tolerance on the largest mean removed in a pass, relative to
+    the largest absolute value of the data
+    :param max_iter: largest number of passes
+    :return: a demeaned copy of Z
+    """
+    Z = np.array(Z, dtype=float)
+    counts = [np.bincount(codes) for codes in groups]
+    scale = max(np.abs(Z).max(initial=0.0), 1.0)
+    for _ in range(max_iter):
+        largest = 0.0
+        for codes, count in zip(groups, counts):
+            means = np.column_stack([np.bincount(codes, weights=column)
+                                     for column in Z.T]) / count[:, np.newaxis]
+            Z -= means[codes]
+            largest = max(largest, np.abs(means).max(initial=0.0))
+        if len(groups) == 1 or largest <= tol * scale:
+            return Z
+    raise ValueError('demeaning did not converge')
+
+
+def absorbed_fit(X, y, names, groups, tol=1e-7):
+    """
+    Fits a linear model with the fixed effects of the factors absorbed: the
+    remaining columns are regressed within the levels of the factors, which
+    gives the same estimates and residuals as the model with dummy columns
+    for every level, and the residual degrees of freedom account for the
+    absorbed effects.
+
+    :param X: array (n_samples, n_columns), the design matrix of the other
+    terms, without an intercept column
+    :param y: array (n_samples,), the response
+    :param names: names of the columns of X
+    :param groups: list of arrays of level codes of the absorbed factors
+    :param tol: tolerance of the rank detection
+    :return: a LMResults snapshot, with the R squared of the regression
+    within the levels
+    """
+    Z = demean(np.column_stack([X, y]), groups)
+    keep, coef, fitted, residuals, r_inv, _ = qr_solve(Z[:, :-1], Z[:, -1],
+                                                       tol)
+    return summarize([names[j] for j in keep], coef, r_inv @ r_inv.T,
+                     residuals @ residuals, fitted @ fitted,
+                     len(y) - absorbed_df(groups), False, residuals,
+                     readonly(y - residuals))
+
+
+def absorbed_anova(X, y, assign, terms, groups, ss_type=1, tol=1e-7):
+    """
+    Computes the analysis of variance of the terms of a linear model with
+    the fixed effects of the factors absorbed first.
+
+    :param X: array (n_samples, n_columns), the design matrix of the other
+    terms, without an intercept column
+    :param y: array (n_samples,), the response
+    :param assign: the term of every column of X, numbered from 1
+    :param terms: the terms as tuples of variable names
+    :param groups: list of arrays of level codes of the absorbed factors
+    :param ss_type: type of the sums of squares, 1, 2 or 3, see anova()
+    :param tol: tolerance of the rank detection
+    :return: an AOVResults snapshot
+    """
+    Z = demean(np.column_stack([X, y]), groups)
+    results = anova(Z[:, :-1], Z[:, -1], assign, terms, ss_type, tol)
+    return results._replace(
+        df_residual=results.df_residual - absorbed_df(groups))
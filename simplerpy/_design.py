@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+The class 'Design' parses a model formula in R syntax, e.g. "y ~ x1 + x2:x3",
+and builds the numeric design matrix for it the way model.matrix() does in R.
+It is used by the engines of simplerpy that do not go through R.
+"""
+
+import re
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+NAME = re.compile(r'^[A-Za-z.][A-Za-z0-9._]*$')
+
+
+class Design:
+    def __init__(self, formula, contrasts='treatment'):
+        """
+        Parses the formula into its response, terms and intercept.
+
+        :param formula: formula in R syntax with "+", "-", ":" and "*"
+        operators on plain variable names, i.e. "y ~ x1 + x2 - 1"
+        :param contrasts: coding of the factors, "treatment" to compare every
+        level to the first one like contr.treatment in R, or "sum" for
+        effects summing to zero like contr.sum
+        """
+        if contrasts not in ('treatment', 'sum'):
+            raise ValueError(f'unknown contrasts: {contrasts}')
+        self.contrasts = contrasts
+        self.levels = {}
+        if formula.count('~') != 1:
+            raise ValueError(f'invalid formula: {formula}')
+        lhs, rhs = formula.split('~')
+        self.formula = formula
+        self.response = lhs.strip() or None
+        if self.response is not None and not NAME.match(self.response):
+            raise ValueError(f'unsupported response in formula: '
+                             f'{self.response}, use engine="r" instead')
+        self.intercept = True
+
+        terms = []
+        seen = set()
+        for sign, token in re.findall(r'([+-]?)\s*([^+-]+)',
+                                      rhs.replace(' ', '')):
+            if token in ('0', '1'):
+                self.intercept = (token == '1') != (sign == '-')
+                continue
+            expanded = Design._expand(token)
+            if sign == '-':
+                removed = set(frozenset(term) for term in expanded)
+                terms = [term for term in terms
+                         if frozenset(term) not in removed]
+                seen -= removed
+            else:
+                for term in expanded:
+                    if frozenset(term) not in seen:
+                        seen.add(frozenset(term))
+                        terms.append(term)
+
+        # main effects come before interactions, like terms() in R
+        self.terms = sorted(terms, key=len)
+        self.names = None
+        self.assign = None
+
+    @staticmethod
+    def _expand(token):
+        """
+        Expands a single term of a formula into the interactions it stands
+        for, i.e. "a*b" into a, b and a:b.
+
+        :param token: a term of the formula without its sign
+        :return: a list of tuples of variable names
+        """
+        factors = token.split('*')
+        for factor in factors:
+            for name in factor.split(':'):
+                if not NAME.match(name):
+                    raise ValueError(f'unsupported term in formula: {name}, '
+                                     f'use engine="r" instead')
+        terms = []
+        for order in range(1, len(factors) + 1):
+            for combo in combinations(factors, order):
+                names = []
+                for factor in combo:
+                    names += [name for name in factor.split(':')
+                              if name not in names]
+                terms.append(tuple(names))
+        return terms
+
+    def variables(self):
+        """
+        Returns the names of all variables used on the right hand side of
+        the formula.
+
+        :return: a list of strings
+        """
+        names = []
+        for term in self.terms:
+            names += [name for name in term if name not in names]
+        return names
+
+    def drop_missing(self, data, y=None, extra=()):
+        """
+        Drops the rows with missing values in the variables of the formula,
+        in the response and in extra columns, as na.omit() does for lm() and
+        aov() in R.
+
+        :param data: Pandas DataFrame or dict mapping variable names to
+        array-like columns
+        :param y: array (n_samples,) of the response, taken from data when
+        None
+        :param extra: names of other columns of data that must be complete
+        :return: (data, y) restricted to the complete rows, the same objects
+        when all the rows are complete
+        """
+        names = self.variables() + list(extra)
+        if y is None and self.response is not None:
+            names = [self.response] + names
+        complete = None if y is None else ~np.isnan(y)
+        for name in names:
+            try:
+                missing = np.asarray(pd.isna(data[name]), dtype=bool)
+            except KeyError:
+                raise ValueError(f'variable {name} not found in data')
+            complete = ~missing if complete is None else complete & ~missing
+        if complete is None or complete.all():
+            return data, y
+        if not complete.any():
+            raise ValueError('no rows without missing values')
+        if isinstance(data, pd.DataFrame):
+            data = data[complete]
+        else:
+            data = {name: column[complete]
+                    if isinstance(column, (pd.Series, np.ndarray))
+                    else np.asarray(column)[complete]
+                    for name, column in data.items()}
+        return data, None if y is None else y[complete]
+
+    def build(self, data, n_rows=None):
+        """
+        Builds the design matrix of the formula from the input data, and
+        records the column names and the term each column belongs to.
+        Columns of strings or Pandas categoricals are factors: they are coded
+        with the contrasts of the design, or with one indicator per level
+        when the term without the factor is not in the model, or for the
+        first factor of a model without intercept, as model.matrix() does.
+        The levels are taken from the first data built and kept for the next
+        ones.
+
+        :param data: Pandas DataFrame or dict mapping variable names to
+        array-like columns
+        :param n_rows: number of rows, only needed when the formula has no
+        variables
+        :return: array (n_samples, n_columns) of float numbers
+        """
+        columns = {}
+        for name in self.variables():
+            try:
+                columns[name] = self._column(name, data[name])
+            except KeyError:
+                raise ValueError(f'variable {name} not found in data')
+            n_rows = len(columns[name])
+        if n_rows is None:
+            n_rows = len(data)
+
+        blocks = []
+        names = []
+        assign = []
+        if self.intercept:
+            blocks.append(np.ones((n_rows, 1)))
+            names.append('(Intercept)')
+            assign.append(0)
+        margins = set(frozenset(term) for term in self.terms)
+        margins.add(frozenset())
+        # without an intercept, the first factor of the first term with a
+        # factor takes its place and is coded by one indicator per level
+        full = None
+        if not self.intercept:
+            full = next(((i, name) for i, term in enumerate(self.terms)
+                         for name in term if self.levels[name] is not None
+                         and len(self.levels[name]) > 1), None)
+        for i, term in enumerate(self.terms):
+            block = np.ones((n_rows, 1))
+            labels = ['']
+            for name in term:
+                coded, suffixes = self._code(
+                    name, columns[name],
+                    frozenset(term) - {name} in margins and
+                    (i, name) != full)
+                # the levels of the first variable vary fastest, as in R
+                block = np.einsum('ij,ik->ikj', block, coded).reshape(
+                    n_rows, -1)
+                labels = [label + (':' if label else '') + name + suffix
+                          for suffix in suffixes for label in labels]
+            blocks.append(block)
+            names += labels
+            assign += [i + 1] * len(labels)
+
+        self.names = names
+        self.assign = assign
+        return np.hstack(blocks) if blocks else np.empty((n_rows, 0))
+
+    def record_levels(self, data):
+        """
+        Records the levels of the factors of the formula from the input data,
+        as build() does on first use, without building the design matrix.
+
+        :param data: Pandas DataFrame or dict mapping variable names to
+        array-like columns
+        :return: None, the levels are kept in self.levels
+        """
+        for name in self.variables():
+            try:
+                self._record(name, data[name])
+            except KeyError:
+                raise ValueError(f'variable {name} not found in data')
+
+    def _record(self, name, values):
+        """
+        Records the levels of a variable on first use, None for a numeric
+        variable.
+
+        :param name: name of the variable
+        :param values: array-like column of the variable
+        :return: None
+        """
+        if name in self.levels:
+            return
+        dtype = getattr(values, 'dtype', None)
+        if isinstance(dtype, pd.CategoricalDtype):
+            self.levels[name] = list(dtype.categories)
+        elif np.asarray(values).dtype.kind in 'OUS':
+            if pd.isna(np.asarray(values, dtype=object)).any():
+                raise ValueError(f'missing values in {name}')
+            self.levels[name] = sorted(set(np.asarray(values)))
+        else:
+            self.levels[name] = None
+
+    def _column(self, name, values):
+        """
+        Converts a variable to floats, or to the integer codes of its levels
+        for a factor, recording the levels on first use.
+
+        :param name: name of the variable
+        :param values: array-like column of the variable
+        :return: array (n_samples,) of float numbers, or of level codes for a
+        factor
+        """
+        self._record(name, values)
+        if self.levels[name] is None:
+            return np.asarray(values, dtype=float)
+        codes = pd.Categorical(np.asarray(values, dtype=object),
+                               categories=self.levels[name]).codes
+        if np.any(codes < 0):
+            raise ValueError(f'missing or unknown levels in {name}')
+        return codes
+
+    def _code(self, name, column, contrasts):
+        """
+        Returns the columns a variable contributes to a term.
+
+        :param name: name of the variable
+        :param column: the variable as returned by _column()
+        :param contrasts: whether a factor is coded by contrasts, or by one
+        indicator per level
+        :return: (array (n_samples, n_columns), suffixes of the column names)
+        """
+        levels = self.levels[name]
+        if levels is None:
+            return column[:, np.newaxis], ['']
+        k = len(levels)
+        if contrasts and k < 2:
+            raise ValueError(f'factor {name} needs at least two levels')
+        if not contrasts:
+            matrix, suffixes = np.eye(k), [str(level) for level in levels]
+        elif self.contrasts == 'treatment':
+            matrix = np.eye(k)[:, 1:]
+            suffixes = [str(level) for level in levels[1:]]
+        else:
+            matrix = np.vstack([np.eye(k - 1), -np.ones(k - 1)])
+            suffixes = [str(j + 1) for j in range(k - 1)]
+        return matrix[column], suffixes
+
+    def build_sparse(self, X, feature_names):
+        """
+        Builds the design matrix of the formula as a sparse matrix from a
+        sparse matrix of features, and records the column names and the term
+        each column belongs to like build().
+
+        :param X: scipy.sparse matrix (n_samples, n_features)
+        :param feature_names: names of the columns of X
+        :return: scipy.sparse CSC matrix (n_samples, n_columns)
+        """
+        X = sparse.csc_matrix(X, dtype=float)
+        index = {name: j for j, name in enumerate(feature_names)}
+        for name in self.variables():
+            if name not in index:
+                raise ValueError(f'variable {name} not found in data')
+
+        blocks = []
+        names = []
+        assign = []
+        if self.intercept:
+            blocks.append(sparse.csc_matrix(np.ones((X.shape[0], 1))))
+            names.append('(Intercept)')
+            assign.append(0)
+        # main effects come first and are taken from X in one go
+        main = [term[0] for term in self.terms if len(term) == 1]
+        blocks.append(X[:, [index[name] for name in main]])
+        for term in self.terms[len(main):]:
+            column = X[:, [index[term[0]]]]
+            for name in term[1:]:
+                column = column.multiply(X[:, [index[name]]])
+            blocks.append(sparse.csc_matrix(column))
+        names += [':'.join(term) for term in self.terms]
+        assign += [i + 1 for i in range(len(self.terms))]
+
+        self.names = names
+        self.assign = assign
+        return sparse.hstack(blocks, format='csc')
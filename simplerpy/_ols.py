@@ -0,0 +1,1151 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Numerical helpers shared by the linear model classes in simplerpy. The results
+of a fitted model are kept in an immutable snapshot, so accessors can read
+them without another round trip to R.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+from scipy import linalg, stats
+
+
+def readonly(values, dtype=float):
+    """
+    Returns the input as a NumPy array that can not be written to, without
+    copying it when it already is an array of the requested type. Only a
+    new view is made read-only, the input array itself stays writeable;
+    arrays owned by the caller must be copied first to be frozen.
+
+    :param values: array-like
+    :param dtype: data type of the returned array
+    :return: a read-only NumPy array
+    """
+    arr = np.asarray(values, dtype=dtype).view()
+    arr.flags.writeable = False
+    return arr
+
+
+class LMResults(namedtuple('LMResults',
+                           ['names', 'coef_table', 'residuals',
+                            'fitted_values', 'df_residual', 'sigma',
+                            'r_squared', 'adj_r_squared', 'fstatistic',
+                            'cov_unscaled', 'intercept', 'r_factor',
+                            'model_matrix'])):
+    """
+    Immutable snapshot of a fitted linear model.
+
+    names: coefficient names of the non-aliased terms
+    coef_table: array (n_coef, 4) of estimates, standard errors, t values and
+    p-values, in the same layout as coef(summary(fit)) in R
+    residuals, fitted_values: arrays (n_samples,)
+    df_residual: degrees of freedom of the residuals
+    sigma: residual standard error
+    r_squared, adj_r_squared: (adjusted) coefficient of determination
+    fstatistic: array (f-stat, df1, df2), None for intercept only models
+    cov_unscaled: array (n_coef, n_coef), the inverse of X'X, None when only
+    its diagonal was computed
+    intercept: whether the model has an intercept
+    r_factor: array (n_coef + 1, n_coef + 1), upper triangular Cholesky
+    factor of [X y]'[X y] on the non-aliased columns, None until needed. Its
+    last column holds the effects Q'y and the square root of the RSS
+    model_matrix: array (n_samples, n_coef), the non-aliased columns of the
+    design matrix, None until needed
+    """
+    __slots__ = ()
+
+
+class MultiLMResults(namedtuple('MultiLMResults',
+                                ['names', 'columns', 'coef', 'se', 'tval',
+                                 'pval', 'residuals', 'fitted_values',
+                                 'df_residual', 'sigma', 'r_squared'])):
+    """
+    Immutable snapshot of linear models fitted to several responses on the
+    same design matrix.
+
+    names: coefficient names of the non-aliased terms
+    columns: indices of the non-aliased columns of the design matrix
+    coef, se, tval, pval: arrays (n_coef, n_responses) of estimates, standard
+    errors, t values and p-values
+    residuals, fitted_values: arrays (n_samples, n_responses)
+    df_residual: degrees of freedom of the residuals, shared by all responses
+    sigma, r_squared: arrays (n_responses,) of residual standard errors and
+    coefficients of determination
+    """
+    __slots__ = ()
+
+
+class AOVResults(namedtuple('AOVResults',
+                            ['terms', 'df', 'sum_sq', 'df_residual',
+                             'rss'])):
+    """
+    Immutable snapshot of an analysis of variance table.
+
+    terms: labels of the terms with at least one non-aliased column
+    df, sum_sq: lists of the degrees of freedom and sums of squares of the
+    terms, the sums of squares being arrays (n_responses,) for several
+    responses
+    df_residual: degrees of freedom of the residuals
+    rss: residual sum of squares, an array (n_responses,) for several
+    responses
+    """
+    __slots__ = ()
+
+
+class Influence(namedtuple('Influence',
+                           ['hat', 'rstudent', 'cooks_distance', 'dffits',
+                            'press'])):
+    """
+    Leave-one-out diagnostics of a fitted linear model, arrays (n_samples,)
+    with the same values as the functions of influence.measures() in R.
+
+    hat: leverages, the diagonal of the hat matrix
+    rstudent: externally studentized residuals
+    cooks_distance: Cook's distances
+    dffits: scaled changes of the fitted values
+    press: prediction residuals e_i / (1 - h_i), their sum of squares is the
+    PRESS statistic
+    """
+    __slots__ = ()
+
+
+class RidgePath(namedtuple('RidgePath',
+                           ['lambdas', 'names', 'coefficients', 'df',
+                            'gcv'])):
+    """
+    Ridge regression fits over a grid of penalties, with the same scaling as
+    lm.ridge() in the R package MASS.
+
+    lambdas: array (n_lambdas,) of penalties
+    names: coefficient names
+    coefficients: array (n_lambdas, n_coef) of estimates on the scale of the
+    original features, as coef() of lm.ridge()
+    df: array (n_lambdas,) of effective degrees of freedom, the trace of the
+    ridge hat matrix of the centred design
+    gcv: array (n_lambdas,) of generalized cross-validation scores
+    """
+    __slots__ = ()
+
+
+class Moments:
+    def __init__(self, n_columns):
+        """
+        Initialize empty running moments of data rows with n_columns columns:
+        the count, the column means and the centred cross-product matrix.
+        Together they are sufficient statistics for X'X, X'y, y'y and n.
+
+        :param n_columns: number of columns of the data rows
+        """
+        self.n = 0
+        self.mean = np.zeros(n_columns)
+        self.comoment = np.zeros((n_columns, n_columns))
+
+    @classmethod
+    def of(cls, Z):
+        """
+        Returns the moments of a block of data rows.
+
+        :param Z: array (n_samples, n_columns)
+        :return: a Moments object
+        """
+        moments = cls(Z.shape[1])
+        moments.n = len(Z)
+        if moments.n:
+            moments.mean = Z.mean(axis=0)
+            centred = Z - moments.mean
+            moments.comoment = centred.T @ centred
+        return moments
+
+    def update(self, Z):
+        """
+        Adds a block of data rows to the moments.
+
+        :param Z: array (n_samples, n_columns)
+        :return: the updated Moments object
+        """
+        return self.merge(Moments.of(Z))
+
+    def merge(self, other):
+        """
+        Adds the moments of other data to these moments with the pairwise
+        update of Chan, Golub and LeVeque, which keeps the centred
+        cross-products accurate.
+
+        :param other: a Moments object with the same columns
+        :return: the updated Moments object
+        """
+        if other.n == 0:
+            return self
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        self.comoment = self.comoment + other.comoment + \
+            np.outer(delta, delta) * (self.n * other.n / n)
+        self.mean = self.mean + delta * (other.n / n)
+        self.n = n
+        return self
+
+
+class GroupMoments:
+    def __init__(self):
+        """
+        Initialize empty running moments of a value within the levels of a
+        group: the count, the mean and the centred sum of squares of every
+        level seen so far.
+        """
+        self.levels = {}
+        self.n = np.zeros(0)
+        self.mean = np.zeros(0)
+        self.m2 = np.zeros(0)
+
+    def update(self, groups, values):
+        """
+        Adds a block of observations to the moments, merging the moments of
+        every level in the block with the pairwise update of Chan, Golub and
+        LeVeque as Moments.merge() does.
+
+        :param groups: array (n_samples,) of the levels of the observations
+        :param values: array (n_samples,) of float numbers
+        :return: the updated GroupMoments object
+        """
+        labels, codes = np.unique(groups, return_inverse=True)
+        n = np.bincount(codes, minlength=len(labels)).astype(float)
+        mean = np.bincount(codes, weights=values, minlength=len(labels)) / n
+        m2 = np.bincount(codes, weights=(values - mean[codes]) ** 2,
+                         minlength=len(labels))
+
+        for label in labels:
+            self.levels.setdefault(label, len(self.levels))
+        k = len(self.levels)
+        self.n = np.pad(self.n, (0, k - len(self.n)))
+        self.mean = np.pad(self.mean, (0, k - len(self.mean)))
+        self.m2 = np.pad(self.m2, (0, k - len(self.m2)))
+        index = np.array([self.levels[label] for label in labels], dtype=int)
+
+        total = self.n[index] + n
+        delta = mean - self.mean[index]
+        self.m2[index] += m2 + delta ** 2 * (self.n[index] * n / total)
+        self.mean[index] += delta * (n / total)
+        self.n[index] = total
+        return self
+
+
+def block_moments(X, y):
+    """
+    Returns the moments of the rows [x, y] of a block of a design matrix and
+    its response.
+
+    :param X: array (n_samples, n_columns), block of the design matrix
+    :param y: array (n_samples,), block of the response
+    :return: a Moments object
+    """
+    return Moments.of(np.column_stack([X, y]))
+
+
+def independent_columns(X, tol=1e-7):
+    """
+    Finds the columns of a design matrix that are not aliased, with the same
+    rule as lm() in R: scanning left to right, a column is dropped when the
+    norm of its part orthogonal to the columns kept so far falls below tol
+    times its original norm.
+
+    :param X: array (n_samples, n_columns)
+    :param tol: tolerance of the rank detection, 1e-7 as in R by default
+    :return: (indices of the kept columns, Q and R of the thin QR
+    decomposition of the kept columns)
+    """
+    n, p = X.shape
+    norms = np.sqrt(np.einsum('ij,ij->j', X, X))
+    norms[norms == 0] = 1.0
+    keep = np.arange(p)
+    # one decomposition of all the columns; an aliased column is removed
+    # from the factors by Givens rotations, which leaves the factors of the
+    # columns after it as if it had never been there
+    q, r = linalg.qr(X, mode='economic')
+    j = 0
+    while j < min(keep.size, n):
+        if abs(r[j, j]) < tol * norms[keep[j]]:
+            q, r = linalg.qr_delete(q, r, j, which='col', overwrite_qr=True,
+                                    check_finite=False)
+            keep = np.delete(keep, j)
+        else:
+            j += 1
+    # beyond n columns, the columns kept span all the rows
+    k = min(keep.size, n)
+    return keep[:k], q[:, :k], r[:k, :k]
+
+
+def gram_independent(G, norms, tol=1e-7):
+    """
+    Finds the columns that are not aliased from a cross-product matrix, with
+    the same rule as independent_columns(), using a Cholesky decomposition
+    that skips the aliased columns.
+
+    :param G: array (n_columns, n_columns), the cross-product matrix
+    :param norms: original norms of the columns
+    :param tol: tolerance of the rank detection
+    :return: (indices of the kept columns, lower triangular Cholesky factor
+    of G restricted to the kept columns)
+    """
+    p = len(G)
+    L = np.zeros((p, p))
+    keep = []
+    for j in range(p):
+        k = len(keep)
+        row = linalg.solve_triangular(L[:k, :k], G[keep, j], lower=True)
+        pivot = G[j, j] - row @ row
+        if pivot > (tol * (norms[j] or 1.0)) ** 2:
+            L[k, :k] = row
+            L[k, k] = np.sqrt(pivot)
+            keep.append(j)
+    k = len(keep)
+    return np.array(keep, dtype=int), L[:k, :k]
+
+
+def augmented_factor(r, effects, rss):
+    """
+    Returns the upper triangular Cholesky factor of [X y]'[X y] from the
+    factor R of X'X, the effects Q'y and the residual sum of squares.
+
+    :param r: array (n_coef, n_coef), upper triangular with positive diagonal
+    :param effects: array (n_coef,)
+    :param rss: residual sum of squares
+    :return: array (n_coef + 1, n_coef + 1)
+    """
+    k = len(r)
+    factor = np.zeros((k + 1, k + 1))
+    factor[:k, :k] = r
+    factor[:k, k] = effects
+    factor[k, k] = np.sqrt(rss)
+    return factor
+
+
+def cholesky_update(r, x, sign=1):
+    """
+    Updates in place the upper triangular Cholesky factor R of a matrix A to
+    the one of A + xx' (sign=1) or A - xx' (sign=-1), with plane rotations
+    in O(p^2) operations.
+
+    :param r: array (p, p), upper triangular with positive diagonal
+    :param x: array (p,), the row added or removed
+    :param sign: 1 to add the row, -1 to remove it
+    :return: the updated factor
+    """
+    x = np.array(x, dtype=float)
+    for k in range(len(x)):
+        pivot = r[k, k] ** 2 + sign * x[k] ** 2
+        if pivot <= 0 and k < len(x) - 1:
+            raise ValueError('downdating would make the design rank '
+                             'deficient')
+        new = np.sqrt(max(pivot, 0.0))
+        if k == len(x) - 1:
+            r[k, k] = new
+            break
+        c = new / r[k, k]
+        s = x[k] / r[k, k]
+        r[k, k] = new
+        r[k, k + 1:] = (r[k, k + 1:] + sign * s * x[k + 1:]) / c
+        x[k + 1:] = c * x[k + 1:] - s * r[k, k + 1:]
+    return r
+
+
+def factor_deficient(r_factor, tol=1e-7):
+    """
+    Checks whether the design of a Cholesky factor of [X y]'[X y] has become
+    rank deficient by downdating, with the rule of independent_columns(): the
+    norms of the columns of X are the norms of the columns of R.
+
+    :param r_factor: array (n_coef + 1, n_coef + 1)
+    :param tol: tolerance of the rank detection
+    :return: bool
+    """
+    r = r_factor[:-1, :-1]
+    norms = np.sqrt(np.einsum('ij,ij->j', r, r))
+    norms[norms == 0] = 1.0
+    return bool(np.any(np.abs(np.diag(r)) < tol * norms))
+
+
+def factor_fit(r_factor, names, n, intercept):
+    """
+    Fits a linear model from the Cholesky factor of [X y]'[X y], as kept in
+    LMResults and updated row by row with cholesky_update().
+
+    :param r_factor: array (n_coef + 1, n_coef + 1)
+    :param names: coefficient names of the columns of the factor
+    :param n: number of observations
+    :param intercept: whether the first column is an intercept
+    :return: a LMResults snapshot, without residuals
+    """
+    k = len(r_factor) - 1
+    r = r_factor[:k, :k]
+    effects = r_factor[:k, k]
+    coef = linalg.solve_triangular(r, effects)
+    r_inv = linalg.solve_triangular(r, np.eye(k))
+    mss = effects[int(intercept):] @ effects[int(intercept):]
+    return summarize(names, coef, r_inv @ r_inv.T, r_factor[k, k] ** 2, mss,
+                     n, intercept, r_factor=r_factor)
+
+
+def influence(X, r, residuals, sigma, df_residual):
+    """
+    Computes the leave-one-out diagnostics of a linear model in closed form
+    from the R factor of its QR decomposition, without refitting it.
+
+    :param X: array (n_samples, n_coef), non-aliased columns of the design
+    :param r: array (n_coef, n_coef), upper triangular R factor of X
+    :param residuals: array (n_samples,)
+    :param sigma: residual standard error
+    :param df_residual: degrees of freedom of the residuals
+    :return: an Influence snapshot
+    """
+    q = linalg.solve_triangular(r, X.T, trans='T')
+    hat = np.einsum('ij,ij->j', q, q)
+    # observations fitted exactly, as lm.influence() in R
+    hat[hat > 1 - 10 * np.finfo(float).eps] = 1.0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        press = residuals / (1 - hat)
+        sigma_i = np.sqrt((df_residual * sigma ** 2 - residuals * press) /
+                          (df_residual - 1))
+        rstudent = residuals / (sigma_i * np.sqrt(1 - hat))
+        cooks_distance = (press / sigma) ** 2 * hat / len(r)
+        dffits = rstudent * np.sqrt(hat / (1 - hat))
+    return Influence(hat=readonly(hat), rstudent=readonly(rstudent),
+                     cooks_distance=readonly(cooks_distance),
+                     dffits=readonly(dffits), press=readonly(press))
+
+
+def robust_cov(X, r, residuals, kind, groups=None):
+    """
+    Computes the heteroskedasticity or cluster robust (sandwich) covariance
+    matrix of the estimates of a linear model, as vcovHC() and vcovCL() in
+    the R package sandwich. The meat is accumulated on the rows of X R^-1 in
+    O(n p^2) operations, without an n x n matrix.
+
+    :param X: array (n_samples, n_coef), non-aliased columns of the design
+    :param r: array (n_coef, n_coef), upper triangular R factor of X
+    :param residuals: array (n_samples,)
+    :param kind: "HC0", "HC1", "HC2", "HC3" or "cluster"
+    :param groups: array (n_samples,) of cluster codes from 0, for "cluster"
+    :return: array (n_coef, n_coef)
+    """
+    n, k = X.shape
+    q = linalg.solve_triangular(r, X.T, trans='T')
+    if kind == 'cluster':
+        scores = q * residuals
+        # sum of the scores of the observations within every cluster
+        sums = np.column_stack([np.bincount(groups, weights=row)
+                                for row in scores])
+        n_groups = len(sums)
+        meat = sums.T @ sums * (n_groups / (n_groups - 1) *
+                                (n - 1) / (n - k))
+    else:
+        weights = residuals ** 2
+        if kind in ('HC2', 'HC3'):
+            hat = np.einsum('ij,ij->j', q, q)
+            with np.errstate(divide='ignore'):
+                weights = weights / (1 - hat) ** (1 if kind == 'HC2' else 2)
+        meat = (q * weights) @ q.T
+        if kind == 'HC1':
+            meat *= n / (n - k)
+    r_inv = linalg.solve_triangular(r, np.eye(k))
+    return r_inv @ meat @ r_inv.T
+
+
+def summarize(names, coef, cov_unscaled, rss, mss, n, intercept,
+              residuals=None, fitted_values=None, r_factor=None,
+              model_matrix=None):
+    """
+    Computes the inference statistics of a linear model from its estimates,
+    following summary.lm() in R.
+
+    :param names: coefficient names of the non-aliased terms
+    :param coef: array (n_coef,) of estimates
+    :param cov_unscaled: array (n_coef, n_coef), the inverse of X'X, or
+    array (n_coef,) of its diagonal only when it is too large to keep
+    :param rss: residual sum of squares
+    :param mss: model sum of squares, about the mean when there is an
+    intercept
+    :param n: number of observations
+    :param intercept: whether the model has an intercept
+    :param residuals: array (n_samples,) of residuals if available
+    :param fitted_values: array (n_samples,) of fitted values if available
+    :param r_factor: Cholesky factor of [X y]'[X y] if available
+    :param model_matrix: non-aliased columns of the design matrix if
+    available
+    :return: a LMResults snapshot
+    """
+    rank = len(coef)
+    df_int = int(intercept)
+    rdf = n - rank
+    with np.errstate(divide='ignore', invalid='ignore'):
+        resvar = np.divide(rss, rdf)
+        variances = np.diag(cov_unscaled) if np.ndim(cov_unscaled) == 2 \
+            else cov_unscaled
+        se = np.sqrt(variances * resvar)
+        tval = coef / se
+        pval = 2 * stats.t.sf(np.abs(tval), rdf)
+        if rank != df_int:
+            r_squared = mss / (mss + rss)
+            adj_r_squared = 1 - (1 - r_squared) * np.divide(n - df_int, rdf)
+            fstatistic = readonly([mss / (rank - df_int) / resvar,
+                                   rank - df_int, rdf])
+        else:
+            r_squared = adj_r_squared = 0.0
+            fstatistic = None
+
+    if residuals is not None:
+        residuals = readonly(residuals)
+        fitted_values = readonly(fitted_values)
+    return LMResults(names=tuple(names),
+                     coef_table=readonly(np.column_stack([coef, se, tval,
+                                                          pval])),
+                     residuals=residuals,
+                     fitted_values=fitted_values,
+                     df_residual=rdf,
+                     sigma=float(np.sqrt(resvar)),
+                     r_squared=float(r_squared),
+                     adj_r_squared=float(adj_r_squared),
+                     fstatistic=fstatistic,
+                     cov_unscaled=readonly(cov_unscaled)
+                     if np.ndim(cov_unscaled) == 2 else None,
+                     intercept=bool(intercept),
+                     r_factor=None if r_factor is None else readonly(r_factor),
+                     model_matrix=None if model_matrix is None
+                     else readonly(model_matrix))
+
+
+def qr_solve(X, Y, tol=1e-7):
+    """
+    Solves the least squares problem of one or several responses with a QR
+    decomposition of the design matrix, dropping aliased columns.
+
+    :param X: array (n_samples, n_columns), the design matrix
+    :param Y: array (n_samples,) or (n_samples, n_responses)
+    :param tol: tolerance of the rank detection
+    :return: (indices of the kept columns, estimates, fitted values,
+    residuals, inverse of the triangular factor R, the factor R with a
+    positive diagonal)
+    """
+    keep, q, r = independent_columns(X, tol)
+    effects = q.T @ Y
+    coef = linalg.solve_triangular(r, effects)
+    fitted = q @ effects
+    r_inv = linalg.solve_triangular(r, np.eye(len(keep)))
+    r *= np.where(np.diag(r) < 0, -1.0, 1.0)[:, np.newaxis]
+    return keep, coef, fitted, Y - fitted, r_inv, r
+
+
+def qr_fit(X, y, names, intercept, tol=1e-7):
+    """
+    Fits a linear model by least squares with a QR decomposition of the
+    design matrix, dropping aliased columns like lm() in R.
+
+    :param X: array (n_samples, n_columns), the design matrix
+    :param y: array (n_samples,), the response
+    :param names: names of the columns of X
+    :param intercept: whether the design has an intercept column
+    :param tol: tolerance of the rank detection
+    :return: a LMResults snapshot
+    """
+    keep, coef, fitted, residuals, r_inv, r = qr_solve(X, y, tol)
+    rss = residuals @ residuals
+    centred = fitted - fitted.mean() if intercept else fitted
+    return summarize([names[j] for j in keep], coef, r_inv @ r_inv.T,
+                     rss, centred @ centred, len(y), intercept, residuals,
+                     fitted, augmented_factor(r, r @ coef, rss), X[:, keep])
+
+
+def qr_fit_multi(X, Y, names, intercept, tol=1e-7):
+    """
+    Fits one linear model per column of Y with a single QR decomposition of
+    the shared design matrix.
+
+    :param X: array (n_samples, n_columns), the design matrix
+    :param Y: array (n_samples, n_responses), the responses
+    :param names: names of the columns of X
+    :param intercept: whether the design has an intercept column
+    :param tol: tolerance of the rank detection
+    :return: a MultiLMResults snapshot
+    """
+    n = len(Y)
+    keep, coef, fitted, residuals, r_inv, _ = qr_solve(X, Y, tol)
+    rank = len(keep)
+    rdf = n - rank
+    rss = np.einsum('ij,ij->j', residuals, residuals)
+    centred = fitted - fitted.mean(axis=0) if intercept else fitted
+    mss = np.einsum('ij,ij->j', centred, centred)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        resvar = rss / rdf
+        se = np.sqrt(np.outer(np.einsum('ij,ij->i', r_inv, r_inv), resvar))
+        tval = coef / se
+        pval = 2 * stats.t.sf(np.abs(tval), rdf)
+        if rank != int(intercept):
+            r_squared = mss / (mss + rss)
+        else:
+            r_squared = np.zeros_like(rss)
+    return MultiLMResults(names=tuple(names[j] for j in keep),
+                          columns=readonly(keep, dtype=int),
+                          coef=readonly(coef), se=readonly(se),
+                          tval=readonly(tval), pval=readonly(pval),
+                          residuals=readonly(residuals),
+                          fitted_values=readonly(fitted),
+                          df_residual=rdf, sigma=readonly(np.sqrt(resvar)),
+                          r_squared=readonly(r_squared))
+
+
+def fit_groups(X, y, bounds, intercept, tol=1e-7):
+    """
+    Fits one linear model per group of consecutive rows of the design
+    matrix, keeping only the estimates, standard errors and R squared.
+
+    :param X: array (n_samples, n_columns), the design matrix sorted by group
+    :param y: array (n_samples,), the response sorted by group
+    :param bounds: array (n_groups + 1,) of the first row of every group and
+    the number of rows
+    :param intercept: whether the design has an intercept column
+    :param tol: tolerance of the rank detection
+    :return: (estimates and standard errors as arrays (n_groups, n_columns)
+    with NaN for aliased columns, R squared as array (n_groups,))
+    """
+    n_groups = len(bounds) - 1
+    coef = np.full((n_groups, X.shape[1]), np.nan)
+    se = np.full((n_groups, X.shape[1]), np.nan)
+    r_squared = np.full(n_groups, np.nan)
+    for g in range(n_groups):
+        rows = slice(bounds[g], bounds[g + 1])
+        keep, b, fitted, residuals, r_inv, _ = qr_solve(X[rows], y[rows],
+                                                        tol)
+        rss = residuals @ residuals
+        centred = fitted - fitted.mean() if intercept else fitted
+        mss = centred @ centred
+        with np.errstate(divide='ignore', invalid='ignore'):
+            resvar = rss / (len(residuals) - len(keep))
+            se[g, keep] = np.sqrt(np.einsum('ij,ij->i', r_inv, r_inv) *
+                                  resvar)
+            r_squared[g] = mss / (mss + rss) \
+                if len(keep) != int(intercept) else 0.0
+        coef[g, keep] = b
+    return coef, se, r_squared
+
+
+def rolling_fit(X, y, window, step, intercept, tol=1e-7):
+    """
+    Fits one linear model per window of consecutive rows of the design
+    matrix, keeping only the estimates, standard errors and R squared. The
+    Cholesky factor of [X y]'[X y] is carried from one window to the next
+    with row updates and downdates; a window is refitted by QR when the
+    windows do not overlap, when the factor cannot be downdated, and once
+    every window rows to bound the rounding errors of the downdates.
+
+    :param X: array (n_samples, n_columns), the design matrix
+    :param y: array (n_samples,), the response
+    :param window: number of rows of every window
+    :param step: number of rows between the starts of consecutive windows
+    :param intercept: whether the design has an intercept column
+    :param tol: tolerance of the rank detection
+    :return: (estimates and standard errors as arrays (n_windows, n_columns)
+    with NaN for aliased columns, R squared as array (n_windows,))
+    """
+    starts = range(0, len(y) - window + 1, step)
+    p = X.shape[1]
+    df_int = int(intercept)
+    coef = np.full((len(starts), p), np.nan)
+    se = np.full((len(starts), p), np.nan)
+    r_squared = np.full(len(starts), np.nan)
+    Z = np.column_stack([X, y])
+    factor = None
+    downdated = 0
+    for w, start in enumerate(starts):
+        stop = start + window
+        if factor is not None and step < window and downdated < window:
+            try:
+                for row in Z[stop - step:stop]:
+                    cholesky_update(factor, row, 1)
+                for row in Z[start - step:start]:
+                    cholesky_update(factor, row, -1)
+                downdated += step
+            except ValueError:
+                factor = None
+            # downdates lose accuracy as the design gets close to rank
+            # deficient, such windows are refitted by QR to detect aliasing
+            if factor is not None and factor_deficient(factor,
+                                                       np.sqrt(tol)):
+                factor = None
+        else:
+            factor = None
+
+        if factor is None:
+            downdated = 0
+            keep, b, _, residuals, _, r = qr_solve(X[start:stop],
+                                                   y[start:stop], tol)
+            current = augmented_factor(r, r @ b, residuals @ residuals)
+            # rank deficient windows are fitted by QR only
+            factor = current if len(keep) == p else None
+        else:
+            keep, current = np.arange(p), factor
+
+        k = len(keep)
+        r = current[:k, :k]
+        effects = current[:k, k]
+        rss = current[k, k] ** 2
+        mss = effects[df_int:] @ effects[df_int:]
+        r_inv = linalg.solve_triangular(r, np.eye(k))
+        coef[w, keep] = linalg.solve_triangular(r, effects)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            se[w, keep] = np.sqrt(np.einsum('ij,ij->i', r_inv, r_inv) *
+                                  rss / (window - k))
+            r_squared[w] = mss / (mss + rss) if k != df_int else 0.0
+    return coef, se, r_squared
+
+
+def gram_fit(moments, names, intercept, tol=1e-7, X=None, y=None):
+    """
+    Fits a linear model from the moments of the rows [x, y] of its design
+    matrix and response. An intercept has to be the first column of the
+    design; it is handled through the centred cross-products, which are far
+    better conditioned than X'X. Residuals are only available when the data
+    is passed along.
+
+    :param moments: a Moments object of the rows [x, y]
+    :param names: names of the columns of the design matrix
+    :param intercept: whether the first column is an intercept
+    :param tol: tolerance of the rank detection
+    :param X: array (n_samples, n_columns), the design matrix, optional
+    :param y: array (n_samples,), the response, optional
+    :return: a LMResults snapshot
+    """
+    n = moments.n
+    mean = moments.mean
+    M = moments.comoment
+    raw = M + n * np.outer(mean, mean)
+    norms = np.sqrt(np.diag(raw))
+    start = int(intercept)
+    G = M if intercept else raw
+    x_cols = np.arange(start, len(names))
+
+    keep, L = gram_independent(G[np.ix_(x_cols, x_cols)], norms[x_cols], tol)
+    cols = x_cols[keep]
+    if len(cols):
+        coef = linalg.cho_solve((L, True), G[cols, -1])
+        cov = linalg.cho_solve((L, True), np.eye(len(cols)))
+    else:
+        coef = np.zeros(0)
+        cov = np.zeros((0, 0))
+    rss = max(G[-1, -1] - coef @ G[cols, -1], 0.0)
+    mss = max(G[-1, -1] - rss, 0.0)
+    if intercept:
+        shift = cov @ mean[cols]
+        coef = np.concatenate([[mean[-1] - mean[cols] @ coef], coef])
+        cov = np.block([[1 / n + mean[cols] @ shift, -shift],
+                        [-shift[:, np.newaxis], cov]])
+        cols = np.concatenate([[0], cols])
+    r = linalg.cholesky(raw[np.ix_(cols, cols)])
+    r_factor = augmented_factor(r, linalg.solve_triangular(
+        r, raw[cols, -1], trans='T'), rss)
+    if X is None:
+        return summarize([names[j] for j in cols], coef, cov, rss, mss, n,
+                         intercept, r_factor=r_factor)
+    fitted = X[:, cols] @ coef
+    return summarize([names[j] for j in cols], coef, cov, rss, mss, n,
+                     intercept, y - fitted, fitted, r_factor, X[:, cols])
+
+
+def sweep(A, k, inverse=False):
+    """
+    Sweeps in place the symmetric matrix A on its pivot k, or reverses a
+    previous sweep. Sweeping the cross-product matrix of [X y] on a set of
+    columns of X regresses everything else on them: the swept block holds
+    minus the inverse of their cross-products, the last column the
+    estimates and the residual cross-products, and A[-1, -1] the RSS.
+
+    :param A: array (p, p), symmetric
+    :param k: index of the pivot
+    :param inverse: reverse a sweep on the pivot k
+    :return: the swept matrix
+    """
+    d = A[k, k]
+    col = A[:, k].copy()
+    A -= np.outer(col, col) / d
+    A[k, :] = A[:, k] = (-col if inverse else col) / d
+    A[k, k] = -1 / d
+    return A
+
+
+def nested_rss(X, y, sizes, tol=1e-7):
+    """
+    Computes the residual sums of squares of a sequence of nested linear
+    models from one QR decomposition of the largest design matrix, whose
+    columns are ordered so that every model uses the leading ones: the RSS
+    of a model is the RSS of the largest plus the squared effects of the
+    columns it leaves out.
+
+    :param X: array (n_samples, n_columns), the largest design matrix
+    :param y: array (n_samples,), the response
+    :param sizes: number of leading columns of X of every model
+    :param tol: tolerance of the rank detection
+    :return: (array of residual degrees of freedom, array of RSS)
+    """
+    keep, q, _ = independent_columns(X, tol)
+    effects = q.T @ y
+    residuals = y - q @ effects
+    rss = residuals @ residuals
+    ranks = np.array([np.sum(keep < size) for size in sizes])
+    tails = np.concatenate([np.cumsum((effects ** 2)[::-1])[::-1], [0.0]])
+    return len(y) - ranks, rss + tails[ranks]
+
+
+def anova(X, y, assign, terms, ss_type=1, tol=1e-7):
+    """
+    Computes the analysis of variance table of the terms of a linear model
+    from one QR decomposition of its design matrix, with the columns in the
+    order of the terms. Type I (sequential) sums of squares are the squared
+    effects of the columns of every term, as aov() in R. Type II and III
+    sums of squares, as Anova() in the R package car, compare models with
+    and without the columns of a term; their residual sums of squares come
+    from projections of the effects on columns of the R factor, without
+    another pass over the rows.
+
+    :param X: array (n_samples, n_columns), the design matrix
+    :param y: array (n_samples,), the response, or (n_samples, n_responses)
+    for several responses on the same design
+    :param assign: the term of every column of X, numbered from 1, 0 for the
+    intercept
+    :param terms: the terms as tuples of variable names
+    :param ss_type: 1, 2 or 3
+    :param tol: tolerance of the rank detection
+    :return: an AOVResults snapshot, with arrays (n_responses,) as sums of
+    squares for several responses
+    """
+    keep, q, r = independent_columns(X, tol)
+    return factored_anova(q, r, np.asarray(assign)[keep], y, terms, ss_type)
+
+
+def factored_anova(q, r, kept, y, terms, ss_type=1):
+    """
+    Computes the analysis of variance table of the terms of a linear model
+    as anova() does, from the QR decomposition of the non-aliased columns of
+    its design matrix.
+
+    :param q: array (n_samples, k), Q factor of the non-aliased columns
+    :param r: array (k, k), R factor of the non-aliased columns
+    :param kept: the term of every non-aliased column
+    :param y: array (n_samples,) or (n_samples, n_responses)
+    :param terms: the terms as tuples of variable names
+    :param ss_type: 1, 2 or 3
+    :return: an AOVResults snapshot
+    """
+    effects = q.T @ y
+    labels = []
+    df = []
+    sum_sq = []
+    for i, term in enumerate(terms, 1):
+        cols = kept == i
+        if not np.any(cols):
+            continue
+        if ss_type == 1:
+            ss = np.sum(effects[cols] ** 2, axis=0)
+        else:
+            if ss_type == 2:
+                # the terms the term is marginal to are left out of both
+                others = [j for j, other in enumerate(terms, 1)
+                          if set(term) < set(other)]
+                base = ~np.isin(kept, others + [i])
+            else:
+                base = ~cols
+            ss = _projected(r, effects, base | cols) - \
+                _projected(r, effects, base)
+        labels.append(':'.join(term))
+        df.append(int(np.sum(cols)))
+        sum_sq.append(float(ss) if np.ndim(y) == 1 else ss)
+    # Q has orthonormal columns, so the RSS is |y|^2 - |Q'y|^2 without
+    # forming the residuals
+    rss = np.maximum(np.sum(y ** 2, axis=0) -
+                     np.sum(effects ** 2, axis=0), 0.0)
+    return AOVResults(terms=labels, df=df, sum_sq=sum_sq,
+                      df_residual=len(y) - len(kept),
+                      rss=float(rss) if np.ndim(y) == 1 else rss)
+
+
+def permutation_fstats(arrays, seeds, kept, terms, ss_type=1):
+    """
+    Computes the F statistics of the terms of a linear model on a batch of
+    random permutations of the response, for shared_map(). The permuted
+    responses of the batch are the columns of one matrix, projected on the
+    QR factors of the design at once; its size is bounded by the batch size
+    chosen by the caller.
+
+    :param arrays: [q, r, y], the QR factors of the non-aliased columns of
+    the design and the response
+    :param seeds: seeds of the random permutations, one per permutation
+    :param kept: the term of every non-aliased column
+    :param terms: the terms as tuples of variable names
+    :param ss_type: 1, 2 or 3
+    :return: array (n_permutations, n_terms) of F statistics of the terms
+    with at least one non-aliased column
+    """
+    q, r, y = arrays
+    Y = np.column_stack([y[np.random.default_rng(seed).permutation(len(y))]
+                         for seed in seeds])
+    results = factored_anova(q, r, kept, Y, terms, ss_type)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_sq = np.array(results.sum_sq) / \
+            np.array(results.df)[:, np.newaxis]
+        return (mean_sq / (results.rss / results.df_residual)).T
+
+
+def anova_table(results, responses=None):
+    """
+    Lays out an analysis of variance table like summary.aov() in R, with a
+    last row for the residuals whose F value and p-value are NaN. For
+    several responses the tables are stacked, one after the other, and the
+    F-tests of all of them are computed at once.
+
+    :param results: an AOVResults snapshot
+    :param responses: names of the responses when the sums of squares are
+    arrays (n_responses,), None for a single response
+    :return: a read-only NumPy record array with fields term, df, sum_sq,
+    mean_sq, f_value and p_value, preceded by response for several
+    responses
+    """
+    n_terms = len(results.terms) + 1
+    df = np.append(np.asarray(results.df, dtype=float),
+                   results.df_residual)[:, np.newaxis]
+    sum_sq = np.vstack([np.reshape(results.sum_sq, (n_terms - 1, -1)),
+                        np.reshape(results.rss, (1, -1))])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_sq = sum_sq / df
+        f_value = mean_sq / mean_sq[-1]
+        f_value[-1] = np.nan
+        p_value = stats.f.sf(f_value, df, df[-1])
+    n_responses = sum_sq.shape[1]
+    terms = np.array(list(results.terms) + ['Residuals'], dtype=object)
+    # the table of every response is a column, stacked in column order
+    fields = [np.tile(terms, n_responses),
+              np.repeat(df, n_responses, axis=1).ravel(order='F')] + \
+        [values.ravel(order='F')
+         for values in (sum_sq, mean_sq, f_value, p_value)]
+    names = ['term', 'df', 'sum_sq', 'mean_sq', 'f_value', 'p_value']
+    if responses is not None:
+        fields.insert(0, np.repeat(np.array(responses, dtype=object),
+                                   n_terms))
+        names.insert(0, 'response')
+    table = np.rec.fromarrays(fields, names=names)
+    table.flags.writeable = False
+    return table
+
+
+def _projected(r, effects, cols):
+    """
+    Returns the squared norm of the projection of the response on a subset
+    of the columns of a design, from its R factor and effects Q'y.
+
+    :param r: array (k, k), R factor of the non-aliased columns
+    :param effects: array (k,) or (k, n_responses), the effects Q'y
+    :param cols: boolean mask of the columns of the subset
+    :return: the model sum of squares of the subset, for every response
+    """
+    if not np.any(cols):
+        return 0.0
+    q, _ = np.linalg.qr(r[:, cols])
+    z = q.T @ effects
+    return np.sum(z ** 2, axis=0)
+
+
+def stepwise(A, n, columns, lower, selected, direction, penalty, tol=1e-7):
+    """
+    Selects the terms of a linear model one step at a time like step() in
+    R: every step adds or drops the term that lowers the information
+    criterion n log(RSS / n) + penalty * edf the most, until no term does.
+    The model is kept as a sweep of the cross-product matrix, so the RSS of
+    every candidate follows in closed form from the current sweep and each
+    step costs one sweep of the columns of the chosen term. Columns aliased
+    with the other terms of the model are left unswept and count for no
+    degree of freedom, and terms without any are dropped first, as step()
+    does.
+
+    :param A: array (n_columns + 1, n_columns + 1), the cross-products of
+    [X y] without the intercept column, centred when there is an intercept
+    :param n: number of observations
+    :param columns: list of the column indices of every term
+    :param lower: list of the sets of terms marginal to every term, which
+    must be in the model before it is added and stay until it is dropped
+    :param selected: set of the terms of the starting model
+    :param direction: "both", "forward" or "backward"
+    :param penalty: penalty per parameter, 2 for AIC and log(n) for BIC
+    :param tol: tolerance of the rank detection
+    :return: set of the selected terms
+    """
+    A = np.array(A, dtype=float)
+    norms = np.sqrt(np.diag(A))
+    selected = set(selected)
+    # the swept columns of every selected term, without its columns aliased
+    # with the terms before it, which count for no degree of freedom
+    swept = {}
+
+    def sweep_selected():
+        for term in sorted(selected):
+            rest = [k for k in columns[term] if k not in swept.get(term, [])]
+            if rest:
+                keep, _ = gram_independent(A[np.ix_(rest, rest)],
+                                           norms[rest], tol)
+                for j in keep:
+                    sweep(A, rest[j])
+                swept[term] = swept.get(term, []) + [rest[j] for j in keep]
+
+    sweep_selected()
+    while True:
+        # like step() in R, a term without degrees of freedom is dropped
+        # first, the last one in the order of the terms
+        if direction != 'forward':
+            empty = [term for term in selected if not swept[term] and
+                     not any(term in lower[other] for other in selected)]
+            if empty:
+                selected.remove(max(empty))
+                del swept[max(empty)]
+                continue
+
+        rss = A[-1, -1]
+        edf = sum(len(swept[term]) for term in selected)
+        best, best_criterion = None, n * np.log(rss / n) + penalty * edf
+        for term, cols in enumerate(columns):
+            if term in selected:
+                if direction == 'forward' or \
+                        any(term in lower[other] for other in selected):
+                    continue
+                cols = swept[term]
+                b = A[cols, -1]
+                change = b @ np.linalg.solve(-A[np.ix_(cols, cols)], b)
+                size = -len(cols)
+            else:
+                if direction == 'backward' or not lower[term] <= selected:
+                    continue
+                # only the columns not aliased with the model count
+                keep, L = gram_independent(A[np.ix_(cols, cols)],
+                                           norms[cols], tol)
+                if not len(keep):
+                    continue
+                effects = linalg.solve_triangular(L, A[np.array(cols)[keep],
+                                                       -1], lower=True)
+                change = -effects @ effects
+                size = len(keep)
+            with np.errstate(divide='ignore'):
+                criterion = n * np.log(max(rss + change, 0.0) / n) + \
+                    penalty * (edf + size)
+            if criterion < best_criterion - 1e-10:
+                best, best_criterion = term, criterion
+        if best is None:
+            return selected
+        if best in selected:
+            for k in swept.pop(best):
+                sweep(A, k, inverse=True)
+            selected.remove(best)
+            # columns aliased with the dropped term may now be estimable
+            sweep_selected()
+        else:
+            selected.add(best)
+            sweep_selected()
+
+
+def weighted_fits(Z, centre, weights, names, intercept, tol=1e-7):
+    """
+    Fits one linear model per row of frequency weights of the observations
+    from the weighted cross-products of the centred data, formed one model
+    at a time so that the memory does not grow with the batch.
+
+    :param Z: array (n_samples, n_columns + 1), the rows [x, y] of the design
+    matrix and the response, centred by their column means
+    :param centre: array (n_columns + 1,), the column means subtracted
+    :param weights: array (n_models, n_samples) of non-negative integers
+    :param names: names of the columns of the design matrix
+    :param intercept: whether the first column is an intercept
+    :param tol: tolerance of the rank detection
+    :return: array (n_models, n_columns) of estimates, NaN for aliased columns
+    """
+    counts = weights.sum(axis=1)
+    deltas = (weights @ Z) / counts[:, np.newaxis]
+    coef = np.full((len(weights), len(names)), np.nan)
+    for b in range(len(weights)):
+        moments = Moments(Z.shape[1])
+        moments.n = int(counts[b])
+        moments.mean = centre + deltas[b]
+        moments.comoment = Z.T @ (weights[b][:, np.newaxis] * Z) - \
+            counts[b] * np.outer(deltas[b], deltas[b])
+        results = gram_fit(moments, names, intercept, tol)
+        coef[b, [names.index(name) for name in results.names]] = \
+            results.coef_table[:, 0]
+    return coef
+
+
+def fold_fits(arrays, folds, names, intercept, tol=1e-7):
+    """
+    Fits the linear model on the training rows of a batch of cross-validation
+    folds, for shared_map().
+
+    :param arrays: [Z, centre, fold of every row], see weighted_fits()
+    :param folds: fold numbers of the batch
+    :param names: names of the columns of the design matrix
+    :param intercept: whether the first column is an intercept
+    :param tol: tolerance of the rank detection
+    :return: array (n_folds, n_columns) of estimates
+    """
+    Z, centre, fold_ids = arrays
+    weights = fold_ids != np.asarray(folds)[:, np.newaxis]
+    return weighted_fits(Z, centre, weights.astype(float), names, intercept,
+                         tol)
+
+
+def bootstrap_fits(arrays, seeds, names, intercept, tol=1e-7):
+    """
+    Fits the linear model on a batch of bootstrap resamples of the rows, for
+    shared_map().
+
+    :param arrays: [Z, centre], see weighted_fits()
+    :param seeds: seeds of the random resampling, one per resample
+    :param names: names of the columns of the design matrix
+    :param intercept: whether the first column is an intercept
+    :param tol: tolerance of the rank detection
+    :return: array (n_resamples, n_columns) of estimates
+    """
+    Z, centre = arrays
+    n = len(Z)
+    weights = np.array([np.bincount(np.random.default_rng(seed).integers(
+        0, n, n), minlength=n) for seed in seeds], dtype=float)
+    return weighted_fits(Z, centre, weights, names, intercept, tol)
+
+
+def ridge_path(X, y, lambdas, intercept):
+    """
+    Fits ridge regressions for a grid of penalties from one singular value
+    decomposition of the centred and scaled design, like lm.ridge() in R.
+    The residual sums of squares of all penalties follow from the singular
+    values and the rotated response, without forming the fitted values.
+
+    :param X: array (n_samples, n_columns), the design matrix, with the
+    intercept column first if there is one
+    :param y: array (n_samples,), the response
+    :param lambdas: array (n_lambdas,) of non-negative penalties
+    :param intercept: whether the first column is an intercept
+    :return: (coefficients as array (n_lambdas, n_columns), effective degrees
+    of freedom and GCV scores as arrays (n_lambdas,))
+    """
+    n = len(y)
+    X = X[:, int(intercept):]
+    if intercept:
+        x_mean = X.mean(axis=0)
+        y_mean = y.mean()
+        X = X - x_mean
+        y = y - y_mean
+    scale = np.sqrt(np.einsum('ij,ij->j', X, X) / n)
+    u, d, vt = np.linalg.svd(X / scale, full_matrices=False)
+    rotated = u.T @ y
+    div = d ** 2 + lambdas[:, np.newaxis]
+    shrink = d ** 2 / div
+    coef = (d * rotated / div) @ vt / scale
+    df = shrink.sum(axis=1)
+    rss = y @ y - rotated @ rotated + \
+        (((1 - shrink) * rotated) ** 2).sum(axis=1)
+    gcv = rss / (n - df) ** 2
+    if intercept:
+        coef = np.column_stack([y_mean - coef @ x_mean, coef])
+    return coef, df, gcv
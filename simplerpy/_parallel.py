@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Helpers to spread the work of the model classes in simplerpy over a pool of
+worker processes.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+
+def effective_n_jobs(n_jobs):
+    """
+    Returns the number of worker processes to use, where None means one and
+    negative values count back from the number of CPUs, -1 being all of them.
+
+    :param n_jobs: integer or None
+    :return: a positive integer
+    """
+    if n_jobs is None:
+        return 1
+    if n_jobs < 0:
+        n_jobs = (os.cpu_count() or 1) + 1 + n_jobs
+    if n_jobs < 1:
+        raise ValueError('n_jobs must be a positive integer or negative')
+    return n_jobs
+
+
+def batch_limit(batch_size, n, budget=2 ** 22):
+    """
+    Caps a number of items processed together when every item takes an
+    array of n values, so that a batch holds at most budget values (32 MB
+    of float numbers by default) whatever the number of samples.
+
+    :param batch_size: requested number of items per batch
+    :param n: number of values of every item, i.e. the number of samples
+    :param budget: largest number of values of a batch
+    :return: a positive integer
+    """
+    return max(min(batch_size, budget // max(n, 1)), 1)
+
+
+def split(n, parts):
+    """
+    Splits range(n) into at most the given number of contiguous slices of
+    nearly equal size.
+
+    :param n: number of items
+    :param parts: number of slices
+    :return: a list of slices
+    """
+    parts = max(min(parts, n), 1)
+    bounds = [n * i // parts for i in range(parts + 1)]
+    return [slice(bounds[i], bounds[i + 1]) for i in range(parts)]
+
+
+def parallel_map(func, n_jobs, *iterables):
+    """
+    Applies func to the items of the iterables like map(), on a pool of
+    n_jobs worker processes, or in this process when n_jobs is one.
+
+    :param func: a function that can be pickled
+    :param n_jobs: number of worker processes
+    :param iterables: iterables of the arguments of func
+    :return: a list of results in the order of the arguments
+    """
+    if n_jobs == 1:
+        return list(map(func, *iterables))
+    with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+        return list(pool.map(func, *iterables))
+
+
+def shared_map(func, n_jobs, arrays, *iterables):
+    """
+    Applies func(arrays, *args) to the items of the iterables like
+    parallel_map(), where the NumPy arrays are copied once into shared
+    memory and mapped read-only by the worker processes instead of being
+    pickled with every task.
+
+    :param func: a function that can be pickled, taking the list of arrays as
+    its first argument; its results must not refer to the arrays
+    :param n_jobs: number of worker processes
+    :param arrays: list of NumPy arrays shared by all tasks
+    :param iterables: iterables of the other arguments of func
+    :return: a list of results in the order of the arguments
+    """
+    if n_jobs == 1:
+        return [func(arrays, *args) for args in zip(*iterables)]
+    blocks = []
+    try:
+        handles = []
+        for array in arrays:
+            array = np.ascontiguousarray(array)
+            block = SharedMemory(create=True, size=max(array.nbytes, 1))
+            blocks.append(block)
+            np.ndarray(array.shape, array.dtype, buffer=block.buf)[...] = \
+                array
+            handles.append((block.name, array.shape, array.dtype.str))
+        return parallel_map(partial(_attached, func, handles), n_jobs,
+                            *iterables)
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+
+def _attached(func, handles, *args):
+    """
+    Calls func in a worker process with the arrays of shared_map() mapped
+    from shared memory.
+    """
+    blocks = [SharedMemory(name=name) for name, _, _ in handles]
+    arrays = [np.ndarray(shape, dtype, buffer=block.buf.toreadonly())
+              for block, (_, shape, dtype) in zip(blocks, handles)]
+    try:
+        return func(arrays, *args)
+    finally:
+        # the views have to be released before the blocks are closed
+        arrays.clear()
+        for block in blocks:
+            block.close()
+
+
+def tree_reduce(func, items):
+    """
+    Combines the items pairwise, level by level, like a binary tree, so that
+    every item goes through a logarithmic number of merges.
+
+    :param func: function merging two items into one
+    :param items: a non-empty list of items
+    :return: the merged item
+    """
+    items = list(items)
+    while len(items) > 1:
+        merged = [func(items[i], items[i + 1])
+                  for i in range(0, len(items) - 1, 2)]
+        if len(items) % 2:
+            merged.append(items[-1])
+        items = merged
+    return items[0]
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+The class 'RSession' starts the embedded R interpreter of rpy2 and activates
+the pandas conversion the first time R is used, instead of at import time.
+The model classes of simplerpy share the single instance 'R', so importing
+them, or fitting with the numpy engines, does not pay the R startup cost.
+"""
+
+import logging
+
+
+class RSession:
+    def __init__(self):
+        """
+        Initialize the session object, R is started by the first call to
+        start() or to an R function through this object.
+        """
+        self._r = None
+        self._packages = {}
+
+    def start(self):
+        """
+        Starts R through rpy2 and activates the pandas conversion, if it has
+        not been done yet.
+
+        :return: the R instance of rpy2, robjects.r
+        """
+        if self._r is None:
+            from rpy2 import robjects
+            from rpy2.rinterface_lib.callbacks import logger
+            from rpy2.robjects import pandas2ri
+
+            logger.setLevel(logging.ERROR)
+            pandas2ri.activate()
+            self._r = robjects.r
+        return self._r
+
+    def started(self):
+        """
+        Returns whether R has been started by this session.
+
+        :return: a boolean
+        """
+        return self._r is not None
+
+    def __getattr__(self, name):
+        """
+        Returns the R object of the given name, i.e. R.lm, starting R if
+        needed. Private and special names, probed by copy, pickle or
+        mock, are not looked up in R.
+        """
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.start(), name)
+
+    def __call__(self, code):
+        """
+        Evaluates a string of R code, starting R if needed.
+
+        :param code: R code
+        :return: the value of the code
+        """
+        return self.start()(code)
+
+    def formula(self, f):
+        """
+        Returns a R formula object for the input formula string.
+
+        :param f: formula i.e. "y~x"
+        :return: a R formula object
+        """
+        self.start()
+        from rpy2.robjects import Formula
+        return Formula(f)
+
+    def package(self, name):
+        """
+        Returns an installed R package, imported through rpy2 on first use.
+
+        :param name: name of the package, i.e. "stats"
+        :return: the package object of rpy2
+        """
+        if name not in self._packages:
+            self.start()
+            from rpy2.robjects.packages import importr
+            self._packages[name] = importr(name)
+        return self._packages[name]
+
+
+R = RSession()
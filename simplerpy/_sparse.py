@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Least squares for sparse design matrices, i.e. one-hot encoded features,
+without densifying them: the fit goes through the normal equations, whose
+cross-product matrix is only p x p. It is factored densely when p is small
+and with a sparse Cholesky (the optional package scikit-sparse) or a sparse
+LU decomposition otherwise.
+"""
+
+import numpy as np
+from scipy import sparse
+from scipy.sparse.linalg import splu
+
+from simplerpy._ols import Moments, gram_fit, readonly, summarize
+
+try:
+    from sksparse.cholmod import CholmodError, cholesky
+except ImportError:
+    cholesky = None
+
+
+def sparse_fit(X, y, names, intercept, tol=1e-7, dense_limit=2000):
+    """
+    Fits a linear model by least squares on a sparse design matrix.
+
+    Up to dense_limit columns, the cross-product matrix is formed densely
+    and solved like gram_fit(), dropping aliased columns as lm() in R does.
+    Beyond, it stays sparse: the coefficients are solved with a sparse
+    factorization and the standard errors from the diagonal of its inverse,
+    computed by blocks of columns; the design must then be of full rank.
+
+    :param X: scipy.sparse matrix (n_samples, n_columns), the design matrix
+    :param y: array (n_samples,), the response
+    :param names: names of the columns of X
+    :param intercept: whether the first column is an intercept
+    :param tol: tolerance of the rank detection
+    :param dense_limit: largest number of columns solved densely
+    :return: a LMResults snapshot, without the unscaled covariance matrix
+    beyond dense_limit columns
+    """
+    X = sparse.csc_matrix(X, dtype=float)
+    n, p = X.shape
+    if p <= dense_limit:
+        Z = sparse.hstack([X, y[:, np.newaxis]], format='csc')
+        moments = Moments(p + 1)
+        moments.n = n
+        moments.mean = np.asarray(Z.mean(axis=0)).ravel()
+        moments.comoment = (Z.T @ Z).toarray() - \
+            n * np.outer(moments.mean, moments.mean)
+        results = gram_fit(moments, names, intercept, tol)
+        cols = [names.index(name) for name in results.names]
+        fitted = X[:, cols] @ results.coef_table[:, 0]
+        return results._replace(residuals=readonly(y - fitted),
+                                fitted_values=readonly(fitted))
+
+    G = (X.T @ X).tocsc()
+    solve = _factorize(G, tol)
+    coef = solve(X.T @ y)
+    variances = np.empty(p)
+    for start in range(0, p, 256):
+        stop = min(start + 256, p)
+        unit = np.zeros((p, stop - start))
+        unit[np.arange(start, stop), np.arange(stop - start)] = 1.0
+        variances[start:stop] = solve(unit)[np.arange(start, stop),
+                                            np.arange(stop - start)]
+    fitted = X @ coef
+    residuals = y - fitted
+    centred = fitted - fitted.mean() if intercept else fitted
+    return summarize(names, coef, variances, residuals @ residuals,
+                     centred @ centred, n, intercept, residuals, fitted)
+
+
+def _factorize(G, tol):
+    """
+    Factors a sparse cross-product matrix, with CHOLMOD when scikit-sparse
+    is installed and a sparse LU decomposition otherwise.
+
+    :param G: scipy.sparse CSC matrix (p, p), symmetric positive definite
+    :param tol: tolerance of the rank detection
+    :return: function solving G x = b for arrays b
+    """
+    if cholesky is not None:
+        try:
+            return cholesky(G).solve_A
+        except CholmodError:
+            raise ValueError('design matrix is rank deficient, drop one '
+                             'level of every one-hot encoded factor')
+    try:
+        lu = splu(G)
+    except RuntimeError:
+        lu = None
+    pivots = np.abs(lu.U.diagonal()) if lu is not None else np.zeros(1)
+    if pivots.min() <= tol * max(pivots.max(), 1.0):
+        raise ValueError('design matrix is rank deficient, drop one level '
+                         'of every one-hot encoded factor')
+    return lu.solve
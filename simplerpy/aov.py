@@ -14,12 +14,35 @@ object.
 
 import math
 
-from rpy2 import robjects as ro
-from rpy2.robjects import Formula
-from rpy2.robjects import pandas2ri
+import numpy as np
+import pandas as pd
 
-pandas2ri.activate()
-R = ro.r
+from simplerpy._absorb import absorbed_anova, group_codes
+from simplerpy._design import Design
+from simplerpy._ols import (AOVResults, GroupMoments, anova, anova_table,
+                            factored_anova, independent_columns,
+                            permutation_fstats, readonly)
+from simplerpy._parallel import (batch_limit, effective_n_jobs, shared_map,
+                                 split)
+from simplerpy._session import R
+from simplerpy._tukey import ptukey, qtukey
+
+
+def _results_from_r(model):
+    """
+    Collects the analysis of variance table of a fitted R aov object with a
+    single call to summary() in R.
+
+    :param model: a fitted R aov object
+    :return: an AOVResults snapshot
+    """
+    columns = R('function(m) { s <- summary(m)[[1]]; '
+                'list(trimws(rownames(s)), s$Df, s[["Sum Sq"]]) }')(model)
+    terms = [str(term) for term in columns[0]]
+    df = [float(value) for value in columns[1]]
+    sum_sq = [float(value) for value in columns[2]]
+    return AOVResults(terms=terms[:-1], df=df[:-1], sum_sq=sum_sq[:-1],
+                      df_residual=int(df[-1]), rss=sum_sq[-1])
 
 
 class AOV:
@@ -30,16 +53,305 @@ class AOV:
 
         """
         self._model = None
+        self._table = None
+        self._data = None
+        self._columns = None
+        self._factors = {}
 
-    def fit(self, f, df):
+    def fit(self, f, df, absorb=None, engine='r', ss_type=1):
         """
         Fits the aov model with input formula using aov() in R
-        through the package rpy2.
+        through the package rpy2, or computes its analysis of variance table
+        in NumPy.
         :param f: formula used for aov() i.e. "y~x"
-        :param df: the data frame containing variables of interest
-        :return: None, assign the R model object to self._model
+        :param df: the data frame containing variables of interest, rows
+        with missing values in them are dropped as aov() does
+        :param absorb: names of factors with many levels whose fixed effects
+        are absorbed by the numpy engine instead of being fitted: the
+        sequential sums of squares of the terms of the formula are computed
+        within the levels of the factors, after their effects and the
+        intercept
+        :param engine: "r" to fit with aov() in R, "numpy" to compute the
+        table from a QR decomposition of the design in-process, which
+        supports formulas of numeric variables and factors (columns of
+        strings or categoricals) combined with "+", "-", ":" and "*"
+        :param ss_type: type of the sums of squares: 1 for sequential sums
+        of squares as aov(), 2 or 3 for the types of Anova() in the R package
+        car, only with the numpy engine. Factors are coded with sum to zero
+        contrasts for type 3
+        :return: None, assign the R model object to self._model (None for the
+        numpy engine) and the analysis of variance table to self._table
+        """
+        if ss_type not in (1, 2, 3):
+            raise ValueError(f'unknown ss_type: {ss_type}')
+        if engine not in ('r', 'numpy'):
+            raise ValueError(f'unknown engine: {engine}')
+        if engine == 'r' and ss_type != 1:
+            raise ValueError('ss_type 2 and 3 are only supported by the '
+                             'numpy engine')
+        if engine == 'r' and absorb:
+            raise ValueError('absorb is only supported by the numpy engine')
+        self._data = None
+        self._columns = None
+        self._factors = {}
+        if engine == 'r':
+            self._model = R.aov(R.formula(f), df)
+            self._table = anova_table(_results_from_r(self._model))
+            try:
+                design = Design(f)
+                # copies of the variables only, the design is factored by
+                # the first call to permutation_test() or tukey_hsd()
+                self._columns = (f, {name: df[name].copy() for name in
+                                     [design.response] + design.variables()},
+                                 ss_type)
+            except (ValueError, KeyError):
+                # formulas beyond the numpy engine are only tested in R
+                pass
+            return
+
+        design = Design(f, contrasts='sum' if ss_type == 3 else 'treatment')
+        if design.response is None:
+            raise ValueError('formula must have a response')
+        df, _ = design.drop_missing(df, extra=absorb or [])
+        X = design.build(df)
+        y = np.array(df[design.response], dtype=float)
+        self._model = None
+        if absorb:
+            start = int(design.intercept)
+            results = absorbed_anova(X[:, start:], y, design.assign[start:],
+                                     design.terms, group_codes(df, absorb),
+                                     ss_type)
+        else:
+            q, r, kept = self._keep_data(design, df, X, y, ss_type)
+            results = factored_anova(q, r, kept, y, design.terms, ss_type)
+        self._table = anova_table(results)
+
+    def _keep_data(self, design, df, X, y, ss_type):
+        """
+        Keeps what permutation_test() and tukey_hsd() need from the data of
+        a fit, so that later changes to the data frame do not affect them:
+        the QR factors of the design, the response, and the counts and
+        projected means of the response within the levels of every factor.
+
+        :param design: the Design of the fitted formula, built on df
+        :param df: the data frame of the fit, or the variables copied from
+        it
+        :param X: array (n_samples, n_columns), the design matrix
+        :param y: array (n_samples,), a copy of the response
+        :param ss_type: type of the sums of squares of the fit
+        :return: (q, r, kept), the QR factors of the non-aliased columns of
+        the design and the term of every one of them
+        """
+        keep, q, r = independent_columns(X)
+        kept = np.asarray(design.assign)[keep]
+        self._data = (readonly(q), readonly(r), readonly(kept, dtype=int),
+                      readonly(y), design.terms, ss_type)
+        effects = q.T @ y
+        for i, term in enumerate(design.terms, 1):
+            name = term[0]
+            if len(term) > 1 or design.levels[name] is None:
+                continue
+            levels = design.levels[name]
+            codes = design._column(name, df[name])
+            counts = np.bincount(codes, minlength=len(levels))
+            # the means of model.tables(fit, "means") in R: the projection
+            # of the response on the intercept and the factor, after the
+            # terms before it, averaged within the levels
+            cols = (kept == 0) | (kept == i)
+            means = np.bincount(codes, weights=q[:, cols] @ effects[cols],
+                                minlength=len(levels)) / counts
+            self._factors[name] = (levels, readonly(counts, dtype=int),
+                                   readonly(means))
+        return q, r, kept
+
+    def _fitted_data(self):
+        """
+        Returns what permutation_test() needs from the data of the fit,
+        factoring the design of a model fitted by R on first use from the
+        variables copied at fit time.
+
+        :return: (q, r, kept, y, terms, ss_type), None when the data are
+        not available
+        """
+        if self._data is None and self._columns is not None:
+            f, columns, ss_type = self._columns
+            self._columns = None
+            design = Design(f)
+            columns, _ = design.drop_missing(columns)
+            X = design.build(columns)
+            y = np.array(columns[design.response], dtype=float)
+            self._keep_data(design, columns, X, y, ss_type)
+        return self._data
+
+    @staticmethod
+    def fit_many(formula_rhs, df, responses, ss_type=1):
+        """
+        Computes the analysis of variance tables of the same terms for many
+        responses of a data frame in NumPy. The design is built and factored
+        once, and the sums of squares and F-tests of all the responses are
+        computed together.
+
+        :param formula_rhs: right hand side of the formula, i.e. "x1 + x2" or
+        "~ x1 + x2", with numeric variables and factors as the numpy engine
+        of fit()
+        :param df: the data frame containing variables of interest, rows
+        with missing values in them or in any response are dropped
+        :param responses: names of the response columns
+        :param ss_type: type of the sums of squares, 1, 2 or 3, see fit()
+        :return: a read-only NumPy record array with fields response, term,
+        df, sum_sq, mean_sq, f_value and p_value, stacking the table of
+        every response in the order of responses, each with a last row for
+        the residuals
+        """
+        if ss_type not in (1, 2, 3):
+            raise ValueError(f'unknown ss_type: {ss_type}')
+        design = Design('~' + formula_rhs.split('~')[-1],
+                        contrasts='sum' if ss_type == 3 else 'treatment')
+        df, _ = design.drop_missing(df, extra=responses)
+        X = design.build(df)
+        Y = np.column_stack([np.asarray(df[name], dtype=float)
+                             for name in responses])
+        results = anova(X, Y, design.assign, design.terms, ss_type)
+        return anova_table(results, list(responses))
+
+    @classmethod
+    def from_stream(cls, chunks, group, value):
+        """
+        Fits the one-way analysis of variance of a value by a factor from
+        data read in chunks, i.e. pd.read_csv(..., chunksize=n), keeping only
+        the count, mean and centred sum of squares of every level. The table
+        is the same as fit() with the formula "value ~ group" and the group
+        column as a factor; rows with a missing group or value are dropped,
+        like aov() does.
+
+        :param chunks: iterable of Pandas DataFrames, or dicts mapping names
+        to array-like columns
+        :param group: name of the factor column
+        :param value: name of the response column
+        :return: a fitted AOV object without R model object
+        """
+        moments = GroupMoments()
+        for chunk in chunks:
+            try:
+                groups = np.asarray(chunk[group], dtype=object)
+                values = np.asarray(chunk[value], dtype=float)
+            except KeyError as error:
+                raise ValueError(f'variable {error.args[0]} not found in '
+                                 f'data')
+            complete = ~(pd.isna(groups) | np.isnan(values))
+            moments.update(groups[complete], values[complete])
+
+        k = len(moments.levels)
+        if k < 2:
+            raise ValueError(f'factor {group} needs at least two levels')
+        n = moments.n.sum()
+        grand = moments.n @ moments.mean / n
+        results = AOVResults(
+            terms=[group], df=[k - 1],
+            sum_sq=[float(moments.n @ (moments.mean - grand) ** 2)],
+            df_residual=int(n) - k, rss=float(moments.m2.sum()))
+        model = cls()
+        model._table = anova_table(results)
+        labels = sorted(moments.levels)
+        index = [moments.levels[label] for label in labels]
+        model._factors[group] = (labels, readonly(moments.n[index],
+                                                  dtype=int),
+                                 readonly(moments.mean[index]))
+        return model
+
+    def permutation_test(self, n_perm=10000, n_jobs=None, random_state=None,
+                         batch_size=1000):
+        """
+        Tests the terms of the fitted model by permutations of the response,
+        without assuming normal errors: the p-value of a term is the share of
+        the permutations, the observed data included, whose F statistic is at
+        least the observed one. The QR factors of the design and the
+        response kept at fit time are reused, and the permutations are
+        evaluated in batches as one matrix of permuted responses, on a pool
+        of worker processes if n_jobs is given.
+
+        :param n_perm: number of random permutations
+        :param n_jobs: number of worker processes, -1 for all CPUs, None
+        tests in this process
+        :param random_state: seed of the random permutations
+        :param batch_size: largest number of permutations evaluated
+        together, lowered for large samples to bound the memory of a batch
+        :return: a read-only NumPy record array with fields term, f_value and
+        p_value, one row per term of the fitted table
+        """
+        table = self.table()
+        if n_perm < 1:
+            raise ValueError('n_perm must be positive')
+        if self._fitted_data() is None:
+            raise ValueError('data not available for this fit')
+        q, r, kept, y, terms, ss_type = self._data
+
+        n_jobs = effective_n_jobs(n_jobs)
+        batch_size = batch_limit(batch_size, len(y))
+        batches = split(n_perm, max(n_jobs, math.ceil(n_perm / batch_size)))
+        # one seed per permutation, the results do not depend on the batches
+        seeds = np.random.SeedSequence(random_state).spawn(n_perm)
+        fstats = np.vstack(shared_map(permutation_fstats, n_jobs, [q, r, y],
+                                      [seeds[b] for b in batches],
+                                      [kept] * len(batches),
+                                      [terms] * len(batches),
+                                      [ss_type] * len(batches)))
+        observed = table.f_value[:-1]
+        # ties within rounding count as at least as extreme
+        exceed = fstats >= observed * (1 - np.sqrt(np.finfo(float).eps))
+        p_value = (1 + exceed.sum(axis=0)) / (n_perm + 1)
+        result = np.rec.fromarrays([table.term[:-1], observed, p_value],
+                                   names=['term', 'f_value', 'p_value'])
+        result.flags.writeable = False
+        return result
+
+    def tukey_hsd(self, term, conf_level=0.95):
         """
-        self._model = R.aov(Formula(f), df)
+        Computes Tukey honest significant differences between all pairs of
+        levels of a factor of the fitted model, as TukeyHSD() in R: the means
+        of the response within the levels and their counts are computed at
+        fit time, and the intervals and adjusted p-values come from the
+        studentized range distribution with the residual mean square of the
+        fitted table, with the ptukey() and qtukey() of R evaluated for all
+        the pairs at once. As in TukeyHSD(), the means of a factor after other
+        terms of an unbalanced design are projected means, adjusted for the
+        terms before it, rather than the raw means of the levels.
+
+        :param term: name of a factor of the model, a main effect
+        :param conf_level: family-wise confidence level of the intervals
+        :return: a read-only NumPy record array with fields comparison
+        ("b-a" for the level b against the level a), diff, lwr, upr and
+        p_adj, one row per pair of levels in the order of TukeyHSD()
+        """
+        table = self.table()
+        if term not in table.term[:-1].tolist():
+            raise ValueError(f'term {term} not in the fitted model')
+        if term not in self._factors:
+            self._fitted_data()
+        if term in self._factors:
+            levels, counts, means = self._factors[term]
+        elif self._data is not None:
+            raise ValueError(f'term {term} is not a factor')
+        else:
+            raise ValueError('data not available for this fit')
+
+        k = len(levels)
+        df_residual = table.df[-1]
+        # pairs in the order of the lower triangle of outer(means, means)
+        first, second = np.triu_indices(k, 1)
+        diff = means[second] - means[first]
+        se = np.sqrt(table.mean_sq[-1] / 2 *
+                     (1 / counts[first] + 1 / counts[second]))
+        width = qtukey(conf_level, k, df_residual) * se
+        p_adj = 1 - ptukey(np.abs(diff) / se, k, df_residual)
+        comparisons = [f'{levels[j]}-{levels[i]}'
+                       for i, j in zip(first, second)]
+        result = np.rec.fromarrays(
+            [np.array(comparisons, dtype=object), diff, diff - width,
+             diff + width, p_adj],
+            names=['comparison', 'diff', 'lwr', 'upr', 'p_adj'])
+        result.flags.writeable = False
+        return result
 
     def r_model_obj(self):
         """
@@ -49,88 +361,82 @@ class AOV:
         """
         return self._model
 
+    def table(self):
+        """
+        Returns the analysis of variance table of the fitted model, computed
+        once at fit time, with a last row for the residuals.
+
+        :return: a read-only NumPy record array with fields term, df, sum_sq,
+        mean_sq, f_value and p_value
+        """
+        if self._table is not None:
+            return self._table
+        else:
+            raise ValueError('model not fitted')
+
     def df(self):
         """
         Returns the degrees of freedom on the feature variables of the
-        fitted model, retrieved from the R model object.
+        fitted model, retrieved from the fitted table.
 
         :return: list of integers
         """
-        sumOut = R.summary(self._model)[0]
-        degFree = list(sumOut['Df'])
-        return degFree[:-1]
+        return self.table().df[:-1].tolist()
 
     def df_residual(self):
         """
         Returns the degrees of freedom on residuals of the fitted model
-        , retrieved from the R model object.
+        , retrieved from the fitted table.
 
         :return: an integer
         """
-        df = self._model.rx2('df.residual')[0]
-        return df
+        return int(self.table().df[-1])
 
     def sum_of_squares(self):
         """
 
         Returns the sum of squares based on the fitted model, retrieved
-        from the R model object.
+        from the fitted table.
 
         :return: a list of float numbers
         """
-        sumOut = R.summary(self._model)[0]
-        SSR = list(sumOut['Sum Sq'])
-        return SSR[:-1]
+        return self.table().sum_sq[:-1].tolist()
 
     def sum_of_squares_res(self):
         """
         Returns the sum of squares of the residuals based on the fitted model,
-        retrieved from the R model object.
+        retrieved from the fitted table.
 
         :return: a float number
 
         """
-        SSRes = self._model.rx2('residuals')
-        SSRes = sum(list(map(lambda x: pow(x, 2), SSRes)))
-        return SSRes
+        return float(self.table().sum_sq[-1])
 
     def residual_se(self):
         """
         Returns the residual standard errors from the fitted model, retrieved
-        from the R model object
+        from the fitted table
 
         :return: a float number
         """
-        RSE = math.sqrt(AOV.sum_of_squares_res(self) / AOV.df_residual(self))
-        return RSE
+        return math.sqrt(self.table().mean_sq[-1])
 
     def summary(self):
         """
-        Prints a cleaned summary output for the fitted aov model like in R.
+        Prints a cleaned summary output for the fitted aov model like in R,
+        rendered from the fitted table.
 
         :return: string of summary output
         """
-        output = "Terms" + "\n" + "              " + "\t"
-        maxLength = len("{:e}".format(AOV.sum_of_squares(self)[0])) + 1
-        model = AOV.r_model_obj(self)
-        headers = list(model.rx2('model').columns)
-        for i in range(1, len(headers)):
-            output += f"{headers[i]:>{maxLength}}"
-        output += f"{'Residuals':>{maxLength}}" + "\n" + "Sum of Squares" \
-                  + "\t"
-        SSR = AOV.sum_of_squares(self)
-        for i in range(len(SSR)):
-            output += f"{'{:e}'.format(SSR[i]):>{maxLength}}"
-        sos = AOV.sum_of_squares_res(self)
-        output += f"{'{:e}'.format(sos):>{maxLength}}" + "\n" + \
-                  "Deg. of Freedom" + "\t"
-        degFree = AOV.df(self)
-        degRes = AOV.df_residual(self)
-        for i in range(len(degFree)):
-            output += f"{str(int(degFree[i])):>{maxLength}}"
-        output += f"{str(degRes):>{maxLength}}" + "\n" + "\n" + \
-                  "Residual standard error: "
-        RSE = round(AOV.residual_se(self), 1)
-        output += str(RSE) + "\n" + "Estimated effects may be unbalanced"
+        table = self.table()
+        width = len('{:e}'.format(table.sum_sq[0])) + 1
+        terms = ''.join(f'{term:>{width}}' for term in table.term)
+        sum_sq = ''.join(f'{ss:>{width}e}' for ss in table.sum_sq)
+        df = ''.join(f'{int(df):>{width}}' for df in table.df)
+        lines = ['Terms', '              \t' + terms,
+                 'Sum of Squares\t' + sum_sq, 'Deg. of Freedom\t' + df, '',
+                 f'Residual standard error: {round(self.residual_se(), 1)}',
+                 'Estimated effects may be unbalanced']
+        output = '\n'.join(lines)
         print(output)
         return output
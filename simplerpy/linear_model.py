@@ -11,16 +11,178 @@ bridge package rpy2. This class mimics how most machine learning models in
 Python work and provide extra information retrieved from the R object.
 """
 
-import logging
+import math
+from collections.abc import Iterator
 
+import numpy as np
 import pandas as pd
-from rpy2 import robjects as ro
-from rpy2.rinterface_lib.callbacks import logger as rpy2_logger
-from rpy2.robjects import pandas2ri
+from scipy import sparse, stats
 
-rpy2_logger.setLevel(logging.ERROR)
-pandas2ri.activate()
-R = ro.r
+from simplerpy._absorb import absorbed_fit, group_codes
+from simplerpy._design import Design
+from simplerpy._ols import (LMResults, Moments, RidgePath, augmented_factor,
+                            block_moments, bootstrap_fits, cholesky_update,
+                            factor_deficient, factor_fit, fit_groups,
+                            fold_fits, gram_fit, influence, nested_rss,
+                            qr_fit, qr_fit_multi, readonly, ridge_path,
+                            robust_cov, rolling_fit, stepwise)
+from simplerpy._parallel import (batch_limit, effective_n_jobs,
+                                 parallel_map, shared_map, split,
+                                 tree_reduce)
+from simplerpy._session import R
+from simplerpy._sparse import sparse_fit
+
+COEF_COLUMNS = ['Estimate', 'Std. Error', 't value', 'Pr(>|t|)']
+
+
+def _results_from_r(model):
+    """
+    Collects everything the accessors of LM need from a fitted R lm object
+    with a single call to summary() in R.
+
+    :param model: a fitted R lm object
+    :return: a LMResults snapshot
+    """
+    summ = R.summary(model)
+    names = [str(name) for name in
+             R('function(s) rownames(s$coefficients)')(summ)]
+    if 'fstatistic' in list(summ.names):
+        fstatistic = readonly(summ.rx2('fstatistic'))
+    else:
+        fstatistic = None
+    return LMResults(names=tuple(names),
+                     coef_table=readonly(summ.rx2('coefficients')),
+                     residuals=readonly(model.rx2('residuals')),
+                     fitted_values=readonly(model.rx2('fitted.values')),
+                     df_residual=int(model.rx2('df.residual')[0]),
+                     sigma=float(summ.rx2('sigma')[0]),
+                     r_squared=float(summ.rx2('r.squared')[0]),
+                     adj_r_squared=float(summ.rx2('adj.r.squared')[0]),
+                     fstatistic=fstatistic,
+                     cov_unscaled=readonly(summ.rx2('cov.unscaled')),
+                     intercept='(Intercept)' in names,
+                     r_factor=None,
+                     model_matrix=None)
+
+
+def _format_special(x):
+    """
+    Formats a missing or infinite value like R does.
+
+    :param x: a float number
+    :return: string
+    """
+    if np.isnan(x):
+        return 'NA'
+    return 'Inf' if x > 0 else '-Inf'
+
+
+def _format_column(values, digits=7):
+    """
+    Formats a numeric column the way print() does for a matrix in R: a common
+    number of decimals, switching to scientific notation when it is narrower.
+
+    :param values: array-like of float numbers
+    :param digits: number of significant digits, 7 as in R by default
+    :return: a list of strings
+    """
+    neg = 0
+    mxsl = rgt = mxns = mxe = mxl = -math.inf
+    mne = math.inf
+    for x in values:
+        if not np.isfinite(x):
+            continue
+        if x == 0:
+            kp, nsig, sgn = 0, 1, 0
+        else:
+            sgn = int(x < 0)
+            kp = int(math.floor(math.log10(abs(x))))
+            mant = int(round(abs(x) / 10 ** kp * 10 ** (digits - 1)))
+            if mant >= 10 ** digits:
+                kp += 1
+                mant = int(round(abs(x) / 10 ** kp * 10 ** (digits - 1)))
+            nsig = digits
+            while nsig > 1 and mant % 10 == 0:
+                mant //= 10
+                nsig -= 1
+        left = kp + 1
+        neg = max(neg, sgn)
+        mxsl = max(mxsl, sgn + (left if left > 0 else 1))
+        rgt = max(rgt, nsig - left)
+        mxl = max(mxl, left)
+        mxns = max(mxns, nsig)
+        mxe = max(mxe, kp)
+        mne = min(mne, kp)
+
+    if mxns == -math.inf:
+        return [_format_special(x) for x in values]
+    if mxl < 0:
+        mxsl = 1 + neg
+    rgt = max(rgt, 0)
+    fixed_width = mxsl + rgt + (rgt != 0)
+    exp_digits = 2 if mxe >= 100 or mne <= -99 else 1
+    sci_digits = mxns - 1
+    sci_width = neg + (sci_digits > 0) + sci_digits + 4 + exp_digits
+    if fixed_width <= sci_width:
+        fmt = '{:.%df}' % rgt
+    else:
+        fmt = '{:.%de}' % sci_digits
+    return [fmt.format(x) if np.isfinite(x) else _format_special(x)
+            for x in values]
+
+
+def _format_coefficients(names, table):
+    """
+    Renders the coefficient table of a fitted model like printing
+    summary(fit)$coefficients in R.
+
+    :param names: coefficient names, used as row names
+    :param table: array (n_coef, 4) of estimates, standard errors, t values
+    and p-values
+    :return: string of the printed table
+    """
+    row_width = max(len(name) for name in names)
+    columns = []
+    for j, header in enumerate(COEF_COLUMNS):
+        cells = _format_column(table[:, j])
+        width = max([len(header)] + [len(cell) for cell in cells])
+        columns.append([header.rjust(width)] +
+                       [cell.rjust(width) for cell in cells])
+    rows = [' ' * row_width] + [name.ljust(row_width) for name in names]
+    lines = [row + ''.join(' ' + column[i] for column in columns)
+             for i, row in enumerate(rows)]
+    return '$coefficients\n' + '\n'.join(lines) + '\n\n'
+
+
+def _feature_names(X, feature_name=None):
+    """
+    Returns the names of the input features: the column names of a Pandas
+    DataFrame, the given names or "f1", "f2", ... for array-like input.
+
+    :param X: feature vector, array-like, scipy.sparse matrix or Pandas
+    Dataframe
+    :param feature_name: names of features, used only when X is array-like
+    :return: a list of strings
+    """
+    if isinstance(X, pd.DataFrame):
+        return X.columns.values.tolist()
+    elif feature_name:
+        return list(feature_name)
+    elif sparse.issparse(X):
+        return ['f' + str(i + 1) for i in range(X.shape[1])]
+    else:
+        return ['f' + str(i + 1) for i in range(len(X[0]))]
+
+
+def _additive_formula(res_name, col_names):
+    """
+    Returns the formula regressing the response on all features additively.
+
+    :param res_name: name of the response, may be empty
+    :param col_names: names of the features
+    :return: formula string, i.e. "y ~ x1 + x2"
+    """
+    return res_name + " ~ " + " + ".join(col_names)
 
 
 class LM:
@@ -31,15 +193,22 @@ class LM:
         """
 
         self._model = None
+        self._results = None
+        self._design = None
+        self._features = None
+        self._moments = None
+        self._absorb = None
 
     def fit(self, X, y, feature_name=None, response_name=None, formula=None,
-            verbose=1):
+            verbose=1, engine='r', n_jobs=None, absorb=None):
         """
         Fits the linear model with input training features X_train and target
-        y_train with lm() in R through the package rpy2.
+        y_train with lm() in R through the package rpy2, or by least squares
+        with a QR decomposition in NumPy.
 
         :param X: feature vector, array-like (n_samples, n_features) or
-        Pandas Dataframe
+        Pandas Dataframe, or a scipy.sparse matrix for the numpy engine,
+        which then solves the normal equations without densifying it
         :param y: target vector, array-like (n_samples, 1) or Pandas Series or
         Dataframe
         :param feature_name: names of features, used only when X_train is
@@ -50,8 +219,22 @@ class LM:
         :param formula: formula used for lm() if specified
         :param verbose: prints out formula used for lm() if value equals to 1,
         silenced if 0
+        :param engine: "r" to fit with lm() in R, "numpy" to fit in-process,
+        which supports formulas of numeric variables and factors (columns of
+        strings or categoricals, with treatment contrasts) combined with "+",
+        "-", ":" and "*", and drops the rows with missing values like lm()
+        :param n_jobs: number of worker processes for the numpy engine, -1
+        for all CPUs. The rows are split across the workers, each computes
+        the cross-products of its rows and the results are merged in a tree
+        reduction. None fits in this process
+        :param absorb: names of factors with many levels whose fixed effects
+        are absorbed by the numpy engine instead of being estimated: the
+        other terms are fitted within the levels of the factors, and the
+        residual degrees of freedom account for the absorbed effects. The
+        intercept is absorbed as well, and the model can not predict
 
-        :return: None, assign the R model object to self._model
+        :return: None, assign the R model object to self._model (None for the
+        numpy engine) and a snapshot of its results to self._results
         """
 
         # check if input target vector has a name
@@ -63,35 +246,557 @@ class LM:
             res_name = 'y'
 
         # check if input is a PD Dataframe and prepare data for lm()
-        if type(X) == pd.DataFrame:
-            col_names = X.columns.values.tolist()
-            df = X.copy()
+        col_names = _feature_names(X, feature_name)
 
+        # check if formula for lm() is specified, all features are used if not
+        if not formula:
+            formula = _additive_formula(res_name, [
+                name for name in col_names if name not in (absorb or [])])
+
+        self._features = col_names
+        self._moments = None
+        self._absorb = absorb
+        if sparse.issparse(X) and (engine != 'numpy' or n_jobs is not None
+                                   or absorb):
+            raise ValueError('sparse input is only supported by the numpy '
+                             'engine without n_jobs and absorb')
+        if absorb:
+            if engine != 'numpy' or n_jobs is not None:
+                raise ValueError('absorb is only supported by the numpy '
+                                 'engine without n_jobs')
+            self._design = Design(formula)
+            columns, y = self._design.drop_missing(
+                LM._columns(X, col_names), LM._response(y), absorb)
+            X_design = self._design.build(columns, len(y))
+            start = int(self._design.intercept)
+            self._model = None
+            self._results = absorbed_fit(X_design[:, start:], y,
+                                         self._design.names[start:],
+                                         group_codes(columns, absorb))
+        elif engine == 'numpy' and sparse.issparse(X):
+            y = LM._response(y)
+            self._design = Design(formula)
+            X_design = self._design.build_sparse(X, col_names)
+            self._model = None
+            self._results = sparse_fit(X_design, y, self._design.names,
+                                       self._design.intercept)
+        elif engine == 'numpy':
+            self._design = Design(formula)
+            columns, y = self._design.drop_missing(LM._columns(X, col_names),
+                                                   LM._response(y))
+            X_design = self._design.build(columns, len(y))
+            self._model = None
+            n_jobs = effective_n_jobs(n_jobs)
+            if n_jobs == 1:
+                self._results = qr_fit(X_design, y, self._design.names,
+                                       self._design.intercept)
+            else:
+                blocks = split(len(y), n_jobs)
+                moments = parallel_map(block_moments, n_jobs,
+                                       [X_design[rows] for rows in blocks],
+                                       [y[rows] for rows in blocks])
+                self._results = gram_fit(tree_reduce(Moments.merge, moments),
+                                         self._design.names,
+                                         self._design.intercept,
+                                         X=X_design, y=y)
+        elif n_jobs is not None:
+            raise ValueError('n_jobs is only supported by the numpy engine')
+        elif engine == 'r':
+            if type(X) == pd.DataFrame:
+                df = X.copy()
+            else:
+                df = pd.DataFrame(X, columns=col_names)
+            df[res_name] = y
+            try:
+                self._design = Design(formula)
+                # records the levels of the factors of the training data, so
+                # that predictions with unseen levels go to predict() in R
+                self._design.record_levels(df)
+            except ValueError:
+                self._design = None
+            self._model = R.lm(formula, data=df)
+            self._results = _results_from_r(self._model)
         else:
-            if feature_name:
-                col_names = feature_name
+            raise ValueError(f'unknown engine: {engine}')
 
+        # check if printout is needed
+        if verbose:
+            print("Formula used for fitted model: " + formula)
+
+    def partial_fit(self, X, y, feature_name=None, response_name=None,
+                    formula=None):
+        """
+        Adds a chunk of training data to the model without keeping it in
+        memory, i.e. chunks from a generator or from
+        pd.read_csv(..., chunksize=n). Only the sufficient statistics of the
+        chunks are accumulated; call finalize() to obtain the fitted model.
+        The formula and features are fixed by the first chunk.
+
+        :param X: chunk of feature vectors, array-like (n_samples, n_features)
+        or Pandas Dataframe
+        :param y: chunk of target vector, array-like (n_samples, 1) or Pandas
+        Series or Dataframe
+        :param feature_name: names of features, used only on the first chunk
+        when X is array-like
+        :param response_name: name of the target, used only on the first
+        chunk when y is array-like
+        :param formula: formula of plain numeric variables, used only on the
+        first chunk, all features are used if not specified
+
+        :return: None, update the statistics in self._moments
+        """
+        if self._moments is None:
+            if isinstance(y, pd.Series):
+                res_name = y.name
             else:
-                col_names = []
-                for i in range(len(X[0])):
-                    col_names.append('f' + str(i + 1))
-            df = pd.DataFrame(X, columns=col_names)
+                res_name = response_name or 'y'
+            self._features = _feature_names(X, feature_name)
+            if not formula:
+                formula = _additive_formula(res_name, self._features)
+            self._design = Design(formula)
+            self._absorb = None
 
-        df[res_name] = y
+        y = LM._response(y)
+        X_design = self._design.build(LM._columns(X, self._features), len(y))
+        if self._moments is None:
+            self._moments = Moments(X_design.shape[1] + 1)
+        self._moments.update(np.column_stack([X_design, y]))
 
-        # check if formula for lm() is specified, all features are used if not
+    def finalize(self):
+        """
+        Fits the model from the statistics accumulated by partial_fit(). The
+        coefficients and inference statistics are the same as fit() with the
+        numpy engine on all the chunks; residuals and fitted values are not
+        available. More chunks can be added afterwards and finalize() called
+        again.
+
+        :return: None, assign a snapshot of the results to self._results
+        """
+        if not self._moments or not self._moments.n:
+            raise ValueError('no data passed to partial_fit()')
+        self._model = None
+        self._results = gram_fit(self._moments, self._design.names,
+                                 self._design.intercept)
+
+    @classmethod
+    def fit_groups(cls, df, by, formula, n_jobs=None, batch_size=1000):
+        """
+        Fits the same formula separately on every group of rows of a data
+        frame with the numpy engine. The design matrix is built once, and
+        the groups are fitted in batches of batch_size groups, on a pool of
+        worker processes if n_jobs is given.
+
+        :param df: Pandas Dataframe with the response, the features and the
+        grouping columns
+        :param by: name or list of names of the grouping columns
+        :param formula: formula of plain numeric variables, i.e. "y ~ x1 + x2"
+        :param n_jobs: number of worker processes, -1 for all CPUs, None fits
+        in this process
+        :param batch_size: number of groups fitted together in one task
+
+        :return: Pandas Dataframe with one row per group indexed by the group
+        keys, with columns "n" and "r_squared", and the estimates and
+        standard errors of every coefficient under "coefficient" and
+        "standard_error" (NaN for coefficients aliased in a group)
+        """
+        design = Design(formula)
+        if design.response is None:
+            raise ValueError('formula must have a response')
+        X = design.build(df)
+        y = np.asarray(df[design.response], dtype=float)
+
+        # sort the rows by group so that every group is a block of rows
+        grouped = df.groupby(by, sort=True)
+        sizes = grouped.size()
+        codes = grouped.ngroup().to_numpy()
+        order = np.argsort(codes, kind='stable')
+        order = order[codes[order] >= 0]
+        X = X[order]
+        y = y[order]
+        bounds = np.concatenate([[0], np.cumsum(sizes.to_numpy())])
+
+        batches = [slice(start, min(start + batch_size, len(sizes)))
+                   for start in range(0, len(sizes), batch_size)]
+        rows = [slice(bounds[b.start], bounds[b.stop]) for b in batches]
+        results = parallel_map(fit_groups, effective_n_jobs(n_jobs),
+                               [X[r] for r in rows], [y[r] for r in rows],
+                               [bounds[b.start:b.stop + 1] - bounds[b.start]
+                                for b in batches],
+                               [design.intercept] * len(batches))
+        coef = np.vstack([result[0] for result in results])
+        se = np.vstack([result[1] for result in results])
+
+        table = {('n', ''): sizes.to_numpy(),
+                 ('r_squared', ''): np.concatenate([result[2]
+                                                    for result in results])}
+        for j, name in enumerate(design.names):
+            table[('coefficient', name)] = coef[:, j]
+        for j, name in enumerate(design.names):
+            table[('standard_error', name)] = se[:, j]
+        return pd.DataFrame(table, index=sizes.index)
+
+    @classmethod
+    def rolling_fit(cls, X, y, window, step=1, feature_name=None,
+                    formula=None):
+        """
+        Fits the linear model on every window of window consecutive rows with
+        the numpy engine, moving by step rows between windows. Overlapping
+        windows are not refitted: the fit is updated with the rows entering
+        the window and downdated with the rows leaving it.
+
+        :param X: feature vector, array-like (n_samples, n_features) or
+        Pandas Dataframe, in time order
+        :param y: target vector, array-like or Pandas Series, in time order
+        :param window: number of rows of every window
+        :param step: number of rows between the starts of consecutive windows
+        :param feature_name: names of features, used only when X is
+        array-like
+        :param formula: formula of plain numeric variables, all features are
+        used additively if not specified
+
+        :return: Pandas Dataframe with one row per window indexed by the index
+        of its last row (its position for array-like input), with the columns
+        "n" and "r_squared", and the estimates and standard errors of every
+        coefficient under "coefficient" and "standard_error" (NaN for
+        coefficients aliased in a window)
+        """
+        if window < 1 or step < 1:
+            raise ValueError('window and step must be positive')
+        design, X_design, values = LM._design_matrix(X, y, feature_name,
+                                                     formula)
+        coef, se, r_squared = rolling_fit(X_design, values, window, step,
+                                          design.intercept)
+
+        ends = np.arange(window - 1, len(values), step)
+        if isinstance(X, pd.DataFrame):
+            index = X.index[ends]
+        elif isinstance(y, (pd.Series, pd.DataFrame)):
+            index = y.index[ends]
+        else:
+            index = pd.Index(ends)
+        table = {('n', ''): np.full(len(ends), window),
+                 ('r_squared', ''): r_squared}
+        for j, name in enumerate(design.names):
+            table[('coefficient', name)] = coef[:, j]
+        for j, name in enumerate(design.names):
+            table[('standard_error', name)] = se[:, j]
+        return pd.DataFrame(table, index=index)
+
+    @classmethod
+    def cross_validate(cls, X, y, k=10, feature_name=None, formula=None,
+                       n_jobs=None, random_state=None, batch_size=100):
+        """
+        Estimates the out-of-sample error of the linear model by k-fold
+        cross-validation with the numpy engine. The design matrix is built
+        once and shared with the worker processes through shared memory, and
+        the folds are fitted in batches from weighted cross-products.
+
+        :param X: feature vector, array-like (n_samples, n_features) or
+        Pandas Dataframe
+        :param y: target vector, array-like or Pandas Series
+        :param k: number of folds, the number of samples for leave-one-out
+        :param feature_name: names of features, used only when X is
+        array-like
+        :param formula: formula of plain numeric variables, all features are
+        used additively if not specified
+        :param n_jobs: number of worker processes, -1 for all CPUs, None fits
+        in this process
+        :param random_state: seed of the random assignment of the folds
+        :param batch_size: largest number of folds fitted together in one
+        task, lowered for large samples to bound the memory of a batch
+
+        :return: array (k,) of the mean squared prediction errors of the folds
+        """
+        design, X_design, values = LM._design_matrix(X, y, feature_name,
+                                                     formula)
+        n = len(values)
+        if not 2 <= k <= n:
+            raise ValueError('k must be between 2 and the number of samples')
+        fold_ids = np.empty(n, dtype=int)
+        order = np.random.default_rng(random_state).permutation(n)
+        for fold, rows in enumerate(split(n, k)):
+            fold_ids[order[rows]] = fold
+
+        Z = np.column_stack([X_design, values])
+        centre = Z.mean(axis=0)
+        n_jobs = effective_n_jobs(n_jobs)
+        batch_size = batch_limit(batch_size, n)
+        batches = split(k, max(n_jobs, math.ceil(k / batch_size)))
+        coef = np.vstack(shared_map(fold_fits, n_jobs,
+                                    [Z - centre, centre, fold_ids],
+                                    [range(k)[b] for b in batches],
+                                    [design.names] * len(batches),
+                                    [design.intercept] * len(batches)))
+
+        # aliased columns do not contribute to the predictions
+        coef = np.nan_to_num(coef)
+        errors = np.empty(k)
+        for fold in range(k):
+            rows = fold_ids == fold
+            residuals = values[rows] - X_design[rows] @ coef[fold]
+            errors[fold] = residuals @ residuals / len(residuals)
+        return errors
+
+    @classmethod
+    def bootstrap(cls, X, y, n_boot=1000, feature_name=None, formula=None,
+                  n_jobs=None, random_state=None, batch_size=100):
+        """
+        Resamples the observations with replacement and fits the linear model
+        on every resample with the numpy engine. The design matrix is built
+        once and shared with the worker processes through shared memory, and
+        the resamples are fitted in batches from weighted cross-products.
+
+        :param X: feature vector, array-like (n_samples, n_features) or
+        Pandas Dataframe
+        :param y: target vector, array-like or Pandas Series
+        :param n_boot: number of bootstrap resamples
+        :param feature_name: names of features, used only when X is
+        array-like
+        :param formula: formula of plain numeric variables, all features are
+        used additively if not specified
+        :param n_jobs: number of worker processes, -1 for all CPUs, None fits
+        in this process
+        :param random_state: seed of the resampling
+        :param batch_size: largest number of resamples fitted together in one
+        task, lowered for large samples to bound the memory of a batch
+
+        :return: Pandas Dataframe (n_boot, n_coef) of the estimates of every
+        resample, NaN for coefficients aliased in a resample
+        """
+        design, X_design, values = LM._design_matrix(X, y, feature_name,
+                                                     formula)
+        Z = np.column_stack([X_design, values])
+        centre = Z.mean(axis=0)
+        n_jobs = effective_n_jobs(n_jobs)
+        batch_size = batch_limit(batch_size, len(values))
+        batches = split(n_boot, max(n_jobs, math.ceil(n_boot / batch_size)))
+        # one seed per resample, the results do not depend on the batches
+        seeds = np.random.SeedSequence(random_state).spawn(n_boot)
+        coef = np.vstack(shared_map(bootstrap_fits, n_jobs,
+                                    [Z - centre, centre],
+                                    [seeds[b] for b in batches],
+                                    [design.names] * len(batches),
+                                    [design.intercept] * len(batches)))
+        return pd.DataFrame(coef, columns=design.names)
+
+    @classmethod
+    def ridge_path(cls, X, y, lambdas, feature_name=None, formula=None):
+        """
+        Fits ridge regressions of the linear model for a whole grid of
+        penalties like lm.ridge() in the R package MASS: the features are
+        centred and scaled to unit root mean square, and all penalties are
+        solved together from one singular value decomposition.
+
+        :param X: feature vector, array-like (n_samples, n_features) or
+        Pandas Dataframe
+        :param y: target vector, array-like or Pandas Series
+        :param lambdas: array-like of non-negative penalties
+        :param feature_name: names of features, used only when X is
+        array-like
+        :param formula: formula of plain numeric variables, all features are
+        used additively if not specified
+
+        :return: namedtuple with fields lambdas, names, coefficients (array
+        (n_lambdas, n_coef) on the scale of the features), df (effective
+        degrees of freedom) and gcv (generalized cross-validation scores)
+        """
+        # a copy, so that the path does not change with the caller's array
+        lambdas = np.atleast_1d(np.array(lambdas, dtype=float))
+        if np.any(lambdas < 0):
+            raise ValueError('lambdas must be non-negative')
+        design, X_design, values = LM._design_matrix(X, y, feature_name,
+                                                     formula)
+        coef, df, gcv = ridge_path(X_design, values, lambdas,
+                                   design.intercept)
+        return RidgePath(lambdas=readonly(lambdas),
+                         names=tuple(design.names),
+                         coefficients=readonly(coef), df=readonly(df),
+                         gcv=readonly(gcv))
+
+    @classmethod
+    def stepwise(cls, X, y, direction='both', criterion='aic',
+                 feature_name=None, response_name=None, formula=None,
+                 engine='numpy'):
+        """
+        Selects the terms of the linear model by stepwise regression like
+        step() in R, keeping the intercept. Candidate models are evaluated
+        from sweeps of the cross-product matrix of the design instead of
+        being refitted; only the selected model is fitted.
+
+        :param X: feature vector, array-like (n_samples, n_features) or
+        Pandas Dataframe
+        :param y: target vector, array-like or Pandas Series
+        :param direction: "both" or "backward" to start from all the terms,
+        "forward" to start from the intercept only
+        :param criterion: "aic" or "bic"
+        :param feature_name: names of features, used only when X is
+        array-like
+        :param response_name: name of the target, used when y is array-like
+        :param formula: formula of plain numeric variables with all the
+        candidate terms, all features are used additively if not specified;
+        interactions are only added after their main effects and dropped
+        before them
+        :param engine: engine the selected model is fitted with, see fit()
+
+        :return: (formula of the selected model, the fitted LM object)
+        """
+        if direction not in ('both', 'forward', 'backward'):
+            raise ValueError(f'unknown direction: {direction}')
+        if criterion not in ('aic', 'bic'):
+            raise ValueError(f'unknown criterion: {criterion}')
+        if isinstance(y, pd.Series):
+            res_name = y.name
+        else:
+            res_name = response_name or 'y'
+        design, X_design, values = LM._design_matrix(X, y, feature_name,
+                                                     formula)
+        n = len(values)
+        Z = np.column_stack([X_design[:, design.intercept:], values])
+        A = Moments.of(Z).comoment if design.intercept else Z.T @ Z
+
+        terms = design.terms
+        columns = [[j - design.intercept for j, term in
+                    enumerate(design.assign) if term == i + 1]
+                   for i in range(len(terms))]
+        lower = [{s for s, other in enumerate(terms)
+                  if set(other) < set(term)} for term in terms]
+        start = set() if direction == 'forward' else set(range(len(terms)))
+        penalty = 2 if criterion == 'aic' else math.log(n)
+        selected = stepwise(A, n, columns, lower, start, direction, penalty)
+
+        rhs = ' + '.join(':'.join(term) for i, term in enumerate(terms)
+                         if i in selected)
+        if not design.intercept:
+            rhs = rhs + ' - 1' if rhs else '0'
+        formula = f'{res_name} ~ {rhs or 1}'
+        model = cls()
+        model.fit(X, y, feature_name=feature_name,
+                  response_name=response_name, formula=formula, verbose=0,
+                  engine=engine)
+        return formula, model
+
+    @staticmethod
+    def compare(*models, X=None, y=None, feature_name=None):
+        """
+        Compares a sequence of nested linear models by F-tests like anova()
+        in R, each model against the previous one. All the residual sums of
+        squares come from one QR decomposition of the largest design with
+        its columns ordered by the model that introduces them, instead of a
+        fit per model.
+
+        :param models: fitted LM objects on the same data, or formulas of
+        plain numeric variables fitted on X and y, from the smallest model
+        to the largest
+        :param X: feature vector, array-like or Pandas Dataframe, required
+        for formulas
+        :param y: target vector, array-like or Pandas Series, required for
+        formulas
+        :param feature_name: names of features, used only when X is
+        array-like
+        :return: Pandas DataFrame with one row per model and the columns
+        Res.Df, RSS, Df, Sum of Sq, F and Pr(>F)
+        """
+        if len(models) < 2:
+            raise ValueError('at least two models are needed')
+        if all(isinstance(model, str) for model in models):
+            if X is None or y is None:
+                raise ValueError('X and y are required to compare formulas')
+            values = LM._response(y)
+            columns = LM._columns(X, _feature_names(X, feature_name))
+            names = []
+            for formula in models:
+                design = Design(formula)
+                X_design = design.build(columns, len(values))
+                names.append(design.names)
+            rss = None
+        elif all(isinstance(model, LM) for model in models):
+            for model in models:
+                if not model._results:
+                    raise ValueError('model not fitted')
+                if model._results.residuals is None:
+                    raise ValueError('residuals not available for this fit')
+            largest = models[-1]
+            X_design = largest._model_matrix()
+            values = largest._results.fitted_values + \
+                largest._results.residuals
+            names = [model._results.names for model in models]
+            rss = [model._results.sigma ** 2 * model._results.df_residual
+                   for model in models]
+        else:
+            raise ValueError('models must be all LM objects or all formulas')
+
+        order = []
+        for smaller, larger in zip(names, names[1:]):
+            if not set(smaller) <= set(larger):
+                raise ValueError('models are not nested')
+        for model_names in names:
+            order += [name for name in model_names if name not in order]
+        last = list(names[-1])
+        df_residual, sum_sq = nested_rss(
+            X_design[:, [last.index(name) for name in order]], values,
+            [len(model_names) for model_names in names])
+        if rss is not None and not np.allclose(sum_sq, rss, rtol=1e-6):
+            raise ValueError('models were not fitted on the same data')
+
+        df = (df_residual[:-1] - df_residual[1:]).astype(float)
+        delta = sum_sq[:-1] - sum_sq[1:]
+        scale = sum_sq[-1] / df_residual[-1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            fvalue = np.where(df > 0, delta / df / scale, np.nan)
+        pvalue = stats.f.sf(fvalue, df, df_residual[-1])
+        return pd.DataFrame({'Res.Df': df_residual, 'RSS': sum_sq,
+                             'Df': np.r_[np.nan, df],
+                             'Sum of Sq': np.r_[np.nan, delta],
+                             'F': np.r_[np.nan, fvalue],
+                             'Pr(>F)': np.r_[np.nan, pvalue]},
+                            index=range(1, len(models) + 1))
+
+    @staticmethod
+    def _design_matrix(X, y, feature_name=None, formula=None):
+        """
+        Builds the design matrix of the formula for the numpy engine.
+
+        :param X: feature vector, array-like or Pandas Dataframe
+        :param y: target vector, array-like or Pandas Series
+        :param feature_name: names of features, used only when X is
+        array-like
+        :param formula: formula of plain numeric variables, all features are
+        used additively if not specified
+        :return: (Design object, design matrix, response as NumPy array)
+        """
+        col_names = _feature_names(X, feature_name)
         if not formula:
-            formula = res_name + " ~ "
-            for i in range(len(col_names)):
-                formula += col_names[i]
-                if i != len(col_names) - 1:
-                    formula += " + "
+            formula = _additive_formula('', col_names)
+        design = Design(formula)
+        columns, values = design.drop_missing(LM._columns(X, col_names),
+                                              LM._response(y))
+        X_design = design.build(columns, len(values))
+        return design, X_design, values
 
-        self._model = R.lm(formula, data=df)
+    @staticmethod
+    def _columns(X, col_names):
+        """
+        Returns the features as a mapping from names to columns, without
+        copying a Pandas DataFrame.
 
-        # check if printout is needed
-        if verbose:
-            print("Formula used for fitted model: " + formula)
+        :param X: feature vector, array-like or Pandas Dataframe
+        :param col_names: names of the features
+        :return: Pandas DataFrame or dict of NumPy arrays
+        """
+        if isinstance(X, pd.DataFrame):
+            return X
+        X = np.asarray(X, dtype=float)
+        return dict(zip(col_names, X.T))
+
+    @staticmethod
+    def _response(y):
+        """
+        Returns the target as a one dimensional NumPy array of floats.
+
+        :param y: target vector, array-like or Pandas Series or Dataframe
+        :return: array (n_samples,)
+        """
+        return np.asarray(y, dtype=float).reshape(-1)
 
     def r_model_obj(self):
         """
@@ -101,184 +806,411 @@ class LM:
         """
         if self._model:
             return self._model
+        elif self._results:
+            raise ValueError('model not fitted with the R engine')
         else:
             raise ValueError('model not fitted')
 
     def coefficient(self):
         """
         Returns the coefficients of the fitted linear model, retrieved from
-        the R model object.
+        the fitted results.
 
         :return: a list of float numbers
         """
-        if self._model:
-            coeff = [result[0] for result in
-                     R.summary(self._model).rx('coefficients')[0]]
-            return coeff
+        if self._results:
+            return self._results.coef_table[:, 0].tolist()
         else:
             raise ValueError('model not fitted')
 
     def df_residual(self):
         """
         Returns the degree of freedom on residuals of the fitted model,
-        retrieved from the R model object.
+        retrieved from the fitted results.
 
-        :return: a float number
+        :return: an integer
         """
-        if self._model:
-            df = self._model.rx('df.residual')[0][0]
-            return df
+        if self._results:
+            return self._results.df_residual
         else:
             raise ValueError('model not fitted')
 
-    def residuals(self):
+    def residuals(self, as_list=False):
         """
         Returns the residuals on training data based on the fitted model,
-        retrieved from the R model object.
+        retrieved from the fitted results. The array is a read-only view of
+        the fitted results, no copy is made.
 
-        :return: a list of float numbers
+        :param as_list: returns a list of float numbers instead if True
+        :return: a read-only array (n_samples,)
         """
-        if self._model:
-            resid = self._model.rx('residuals')[0]
-            return resid.tolist()
+        if self._results:
+            if self._results.residuals is None:
+                raise ValueError('residuals not available for this fit')
+            if as_list:
+                return self._results.residuals.tolist()
+            return self._results.residuals
         else:
             raise ValueError('model not fitted')
 
-    def standard_error(self):
+    def standard_error(self, kind=None, groups=None):
         """
         Returns the standard errors on features of the fitted model, retrieved
-        from the R model object.
+        from the fitted results, or heteroskedasticity or cluster robust
+        standard errors computed from the residuals and the QR factor of the
+        fit, as vcovHC() and vcovCL() in the R package sandwich.
 
+        :param kind: None for the classical standard errors, "HC0", "HC1",
+        "HC2" or "HC3" for the heteroskedasticity robust estimators, or
+        "cluster" for the cluster robust estimator with the HC1 and the
+        G / (G - 1) small sample adjustments
+        :param groups: cluster of every training observation, array-like
+        (n_samples,), required for "cluster"
         :return: a list of float numbers
         """
-        if self._model:
-            se = [result[1] for result in
-                  R.summary(self._model).rx('coefficients')[0]]
-            return se
+        if self._results:
+            if kind is None:
+                return self._results.coef_table[:, 1].tolist()
+            if kind not in ('HC0', 'HC1', 'HC2', 'HC3', 'cluster'):
+                raise ValueError(f'unknown kind: {kind}')
+            if self._results.residuals is None:
+                raise ValueError('residuals not available for this fit')
+            codes = None
+            if kind == 'cluster':
+                if groups is None:
+                    raise ValueError('groups required for cluster robust '
+                                     'standard errors')
+                codes, _ = pd.factorize(np.asarray(groups))
+                if len(codes) != len(self._results.residuals):
+                    raise ValueError('groups must have one value per '
+                                     'training observation')
+                if np.any(codes < 0):
+                    raise ValueError('missing values in groups')
+            k = len(self._results.names)
+            cov = robust_cov(self._model_matrix(), self._r_factor()[:k, :k],
+                             self._results.residuals, kind, codes)
+            return np.sqrt(np.diag(cov)).tolist()
         else:
             raise ValueError('model not fitted')
 
-    def predict(self, X_test):
+    def predict(self, X_test, interval=None, level=0.95, chunk_size=100000):
         """
         Takes feature vectors with the same shape as training data and
-        returns predictions based on the fitted model.
+        returns predictions based on the fitted model. Predictions are made
+        in NumPy from the fitted coefficients, chunk by chunk; models fitted
+        by R with a formula the numpy engine does not support are predicted
+        with predict() in R.
 
         :param X_test: feature vectors, each must be of the same shape of the
-        training data
-        :return: a list of float numbers as predictions
+        training data, or an iterator of such chunks, i.e. a generator or
+        pd.read_csv(..., chunksize=n)
+        :param interval: "confidence" or "prediction" to also return the
+        bounds of the interval at the given level, None by default
+        :param level: confidence level of the interval
+        :param chunk_size: number of rows predicted at a time
+        :return: array (n_samples,) of predictions, or (n_samples, 3) of
+        predictions, lower and upper bounds when interval is specified
         """
 
-        if self._model:
-            return R.predict(self._model, X_test)
+        if not self._results:
+            raise ValueError('model not fitted')
+        if interval not in (None, 'confidence', 'prediction'):
+            raise ValueError(f'unknown interval: {interval}')
+
+        if isinstance(X_test, Iterator):
+            return np.concatenate([self.predict(chunk, interval, level,
+                                                chunk_size)
+                                   for chunk in X_test])
+
+        if sparse.issparse(X_test):
+            X_test = sparse.csr_matrix(X_test)
+        n = X_test.shape[0] if sparse.issparse(X_test) else len(X_test)
+        # no rows give an empty output without building any design
+        output = np.empty((n, 3) if interval else n)
+        for start in range(0, n, chunk_size):
+            rows = slice(start, start + chunk_size)
+            if isinstance(X_test, pd.DataFrame):
+                chunk = X_test.iloc[rows]
+            elif sparse.issparse(X_test):
+                chunk = X_test[rows]
+            else:
+                chunk = np.asarray(X_test, dtype=float)[rows]
+            try:
+                output[rows] = self._predict_chunk(chunk, interval, level)
+            except ValueError:
+                if not self._model:
+                    raise
+                if interval:
+                    return np.asarray(R.predict(self._model, X_test,
+                                                interval=interval,
+                                                level=level))
+                return np.asarray(R.predict(self._model, X_test))
+        return output
+
+    def _predict_chunk(self, X_test, interval, level):
+        """
+        Predicts a chunk of feature vectors from the fitted coefficients and,
+        for intervals, the unscaled covariance of the fitted results.
+
+        :param X_test: feature vectors, array-like, scipy.sparse matrix or
+        Pandas Dataframe
+        :param interval: None, "confidence" or "prediction"
+        :param level: confidence level of the interval
+        :return: array (n_samples,) or (n_samples, 3)
+        """
+        results = self._results
+        X_design = self._design_rows(X_test, X_test.shape[0])
+        fit = X_design @ results.coef_table[:, 0]
+        if interval is None:
+            return fit
+        if results.cov_unscaled is None:
+            raise ValueError('intervals not available for this fit')
+        if sparse.issparse(X_design):
+            var = np.asarray(X_design.multiply(
+                X_design @ results.cov_unscaled).sum(axis=1)).ravel()
+        else:
+            var = np.einsum('ij,ij->i', X_design @ results.cov_unscaled,
+                            X_design)
+        var *= results.sigma ** 2
+        if interval == 'prediction':
+            var += results.sigma ** 2
+        width = stats.t.ppf((1 + level) / 2, results.df_residual) * \
+            np.sqrt(var)
+        return np.column_stack([fit, fit - width, fit + width])
+
+    def _design_rows(self, X, n_rows):
+        """
+        Builds the rows of the design matrix of the fitted model for feature
+        vectors, restricted to the non-aliased columns.
+
+        :param X: feature vectors, array-like, scipy.sparse matrix or Pandas
+        Dataframe
+        :param n_rows: number of feature vectors
+        :return: array (n_samples, n_coef), sparse for sparse feature vectors
+        """
+        if self._design is None:
+            raise ValueError('formula not supported by the numpy engine')
+        if self._absorb:
+            raise ValueError('absorbed effects are not estimated')
+        if sparse.issparse(X):
+            X_design = self._design.build_sparse(X, self._features)
+        else:
+            X_design = self._design.build(LM._columns(X, self._features),
+                                          n_rows)
+        missing = set(self._results.names) - set(self._design.names)
+        if missing:
+            raise ValueError(f'terms not supported by the numpy engine: '
+                             f'{missing}')
+        return X_design[:, [self._design.names.index(name)
+                            for name in self._results.names]]
+
+    def _model_matrix(self):
+        """
+        Returns the non-aliased columns of the design matrix of the fitted
+        results. For a model fitted by R it is retrieved on first use from
+        the R model object.
+
+        :return: array (n_samples, n_coef)
+        """
+        if self._results.model_matrix is None:
+            if self._model is None:
+                raise ValueError('model matrix not available for this fit')
+            X = np.asarray(R('model.matrix')(self._model), dtype=float)
+            aliased = np.isnan(np.asarray(R.coef(self._model), dtype=float))
+            self._results = self._results._replace(
+                model_matrix=readonly(X[:, ~aliased]))
+        return self._results.model_matrix
+
+    def _r_factor(self):
+        """
+        Returns the Cholesky factor of [X y]'[X y] of the fitted results. For
+        a model fitted by R it is computed on first use from the model
+        matrix.
+
+        :return: array (n_coef + 1, n_coef + 1)
+        """
+        if self._results.r_factor is None:
+            r = np.linalg.qr(self._model_matrix(), mode='r')
+            r *= np.where(np.diag(r) < 0, -1.0, 1.0)[:, np.newaxis]
+            rss = self._results.sigma ** 2 * self._results.df_residual
+            factor = augmented_factor(r, r @ self._results.coef_table[:, 0],
+                                      rss)
+            self._results = self._results._replace(r_factor=readonly(factor))
+        return self._results.r_factor
+
+    def influence(self):
+        """
+        Returns the leave-one-out diagnostics of the training observations,
+        computed in closed form from the QR factor of the fit, as
+        hatvalues(), rstudent(), cooks.distance() and dffits() in R.
+
+        :return: namedtuple of arrays (n_samples,) with fields hat, rstudent,
+        cooks_distance, dffits and press, the prediction residuals
+        """
+        if self._results:
+            if self._results.residuals is None:
+                raise ValueError('residuals not available for this fit')
+            k = len(self._results.names)
+            return influence(self._model_matrix(), self._r_factor()[:k, :k],
+                             self._results.residuals, self._results.sigma,
+                             self._results.df_residual)
         else:
             raise ValueError('model not fitted')
 
+    def update(self, X, y):
+        """
+        Adds observations to the fitted model without refitting it: the
+        Cholesky factor of the fit is updated in O(p^2) operations per row.
+        All accessors reflect the updated model; residuals and fitted values
+        are no longer available, and a model fitted by R is detached from
+        its R object.
+
+        :param X: feature vectors of the new observations, array-like or
+        Pandas Dataframe with the same features as the training data
+        :param y: targets of the new observations, array-like
+        :return: None, update self._results
+        """
+        self._update_rows(X, y, 1)
+
+    def downdate(self, X, y):
+        """
+        Removes observations from the fitted model without refitting it,
+        the reverse of update(). The observations must have been part of the
+        fit; removing them must leave the design of full rank.
+
+        :param X: feature vectors of the observations, array-like or Pandas
+        Dataframe with the same features as the training data
+        :param y: targets of the observations, array-like
+        :return: None, update self._results
+        """
+        self._update_rows(X, y, -1)
+
+    def _update_rows(self, X, y, sign):
+        """
+        Adds (sign=1) or removes (sign=-1) observations from the fitted
+        model, see update() and downdate().
+        """
+        if not self._results:
+            raise ValueError('model not fitted')
+        y = LM._response(y)
+        rows = np.column_stack([self._design_rows(X, len(y)), y])
+        factor = np.array(self._r_factor())
+        for row in rows:
+            cholesky_update(factor, row, sign)
+        if factor_deficient(factor):
+            raise ValueError('downdating would make the design rank '
+                             'deficient')
+        results = self._results
+        n = results.df_residual + len(results.names) + sign * len(y)
+        self._results = factor_fit(factor, results.names, n,
+                                   results.intercept)
+        self._model = None
+
     def test_stats(self):
         """
         Returns the test statistics for each coefficient of the model,
-        retrieved from the R model object.
+        retrieved from the fitted results.
 
         :return: a list of float numbers
         """
-        if self._model:
-            t_value = [result[2] for result in
-                       R.summary(self._model).rx('coefficients')[0]]
-            return t_value
+        if self._results:
+            return self._results.coef_table[:, 2].tolist()
         else:
             raise ValueError('model not fitted')
 
     def p_value(self):
         """
         Returns the p-value of test of siginificance on each coefficient of the
-        model, retrieved from the R model object.
+        model, retrieved from the fitted results.
 
         :return: a list of float numbers
         """
-        if self._model:
-            p_value = [result[3] for result in
-                       R.summary(self._model).rx('coefficients')[0]]
-            return p_value
+        if self._results:
+            return self._results.coef_table[:, 3].tolist()
         else:
             raise ValueError('model not fitted')
 
-    def fitted_values(self):
+    def fitted_values(self, as_list=False):
         """
         Returns the fitted values on training data based on the fitted model,
-        retrieved from the R model object
+        retrieved from the fitted results. The array is a read-only view of
+        the fitted results, no copy is made.
 
-        :return: a list of float numbers
+        :param as_list: returns a list of float numbers instead if True
+        :return: a read-only array (n_samples,)
         """
-        if self._model:
-            fv = self._model.rx('fitted.values')[0]
-            return fv.tolist()
+        if self._results:
+            if self._results.fitted_values is None:
+                raise ValueError('fitted values not available for this fit')
+            if as_list:
+                return self._results.fitted_values.tolist()
+            return self._results.fitted_values
         else:
             raise ValueError('model not fitted')
 
     def r_squared(self):
         """
-        Returns R squared of the fitted model, retrieved from the R model
-        object
+        Returns R squared of the fitted model, retrieved from the fitted
+        results
 
         :return: a float number
         """
-        if self._model:
-            rs = R.summary(self._model).rx('r.squared')[0][0]
-            return rs
+        if self._results:
+            return self._results.r_squared
         else:
             raise ValueError('model not fitted')
 
     def adj_r_squared(self):
         """
-        Returns adjusted R squared of the fitted model, retrieved from the R
-        model object
+        Returns adjusted R squared of the fitted model, retrieved from the
+        fitted results
 
         :return: a float number
         """
-        if self._model:
-            adj_rs = R.summary(self._model).rx('adj.r.squared')[0][0]
-            return adj_rs
+        if self._results:
+            return self._results.adj_r_squared
         else:
             raise ValueError('model not fitted')
 
     def f_statistic(self):
         """
         Returns f statistic and its degree of freedom of the fitted model in
-        the format of (f-stat, df1, df2), retrieved from the R model object
+        the format of (f-stat, df1, df2), retrieved from the fitted results
 
         :return: a list of float numbers
         """
-        if self._model:
-            fstats = R.summary(self._model).rx('fstatistic')[0]
-            return fstats.tolist()
+        if self._results:
+            if self._results.fstatistic is None:
+                raise ValueError('no F statistic for an intercept only model')
+            return self._results.fstatistic.tolist()
         else:
             raise ValueError('model not fitted')
 
     def f_test_pvalue(self):
         """
         Returns the p-value of F test on the fitted model, calculated based on
-        information retrieved from the R model object using pf() function from
-        R through rpy2
+        the F statistic of the fitted results with the F distribution in SciPy
 
         :return: a float number
         """
-        if self._model:
+        if self._results:
             test_info = self.f_statistic()
             f_stat = test_info[0]
             df_num = test_info[1]
             df_denom = test_info[2]
-            return R.pf(f_stat, df_num, df_denom, **{'lower.tail': False})[0]
+            return float(stats.f.sf(f_stat, df_num, df_denom))
         else:
             raise ValueError('model not fitted')
 
     def residual_se(self):
         """
         Returns the residual standard errors from the fitted model, retrieved
-        from the R model object
+        from the fitted results
 
         :return: a float number
         """
-        if self._model:
-            return R.summary(self._model).rx('sigma')[0][0]
+        if self._results:
+            return self._results.sigma
         else:
             raise ValueError('model not fitted')
 
@@ -289,16 +1221,17 @@ class LM:
 
         :return: String contains the output summary
         """
-        if self._model:
-            output = ""
-            output += str(R.summary(self._model).rx('coefficients'))
+        if self._results:
+            fstats = self.f_statistic()
+            output = _format_coefficients(self._results.names,
+                                          self._results.coef_table)
             output += f'Residual standard error: ' \
                       f'{round(self.residual_se(), 6)} ' \
                       f'on {self.df_residual()} degrees of freedom\n'
             output += f'Mutiple R-squared: {round(self.r_squared() , 6)}, ' \
                       f'Adjusted R-squared: {round(self.adj_r_squared(), 6)}\n'
-            output += f'F-statistic: {round(self.f_statistic()[0], 6)} on ' \
-                      f'{self.f_statistic()[1]} and {self.f_statistic()[2]} ' \
+            output += f'F-statistic: {round(fstats[0], 6)} on ' \
+                      f'{fstats[1]} and {fstats[2]} ' \
                       f'DF with p-value: {round(self.f_test_pvalue(), 6)}'
 
             print(output)
@@ -306,3 +1239,195 @@ class LM:
             return output
         else:
             raise ValueError('model not fitted')
+
+
+class MultiLM:
+    def __init__(self):
+        """
+        Initialize the MultiLM object, fit() must be called before calling
+        all other methods of this object.
+        """
+
+        self._design = None
+        self._results = None
+        self._features = None
+        self._responses = None
+
+    def fit(self, X, Y, feature_name=None, response_name=None,
+            formula=None):
+        """
+        Fits one linear model per column of Y on the same features X. The
+        design matrix is built and decomposed once and shared by all
+        responses.
+
+        :param X: feature vector, array-like (n_samples, n_features) or
+        Pandas Dataframe
+        :param Y: target vectors, array-like (n_samples, n_responses) or
+        Pandas Dataframe
+        :param feature_name: names of features, used only when X is
+        array-like, "f_num" by default
+        :param response_name: names of the targets, used only when Y is
+        array-like, "y_num" by default
+        :param formula: right hand side of the formula used for all the
+        responses, i.e. "~ x1 + x2", all features are used if not specified
+
+        :return: None, assign a snapshot of the results to self._results
+        """
+        if isinstance(Y, pd.DataFrame):
+            self._responses = Y.columns.values.tolist()
+        elif response_name:
+            self._responses = list(response_name)
+        else:
+            self._responses = ['y' + str(i + 1)
+                               for i in range(np.shape(Y)[1])]
+        Y = np.asarray(Y, dtype=float)
+
+        col_names = _feature_names(X, feature_name)
+        self._features = col_names
+        if not formula:
+            formula = _additive_formula('', col_names)
+        self._design = Design(formula)
+        X_design = self._design.build(LM._columns(X, col_names), len(Y))
+        self._results = qr_fit_multi(X_design, Y, self._design.names,
+                                     self._design.intercept)
+
+    def coefficient_names(self):
+        """
+        Returns the names of the coefficients, the rows of the arrays
+        returned by the other methods.
+
+        :return: a list of strings
+        """
+        if self._results:
+            return list(self._results.names)
+        else:
+            raise ValueError('model not fitted')
+
+    def response_names(self):
+        """
+        Returns the names of the responses, the columns of the arrays
+        returned by the other methods.
+
+        :return: a list of strings
+        """
+        if self._results:
+            return list(self._responses)
+        else:
+            raise ValueError('model not fitted')
+
+    def coefficient(self):
+        """
+        Returns the coefficients of every fitted model.
+
+        :return: array (n_coef, n_responses)
+        """
+        if self._results:
+            return self._results.coef
+        else:
+            raise ValueError('model not fitted')
+
+    def standard_error(self):
+        """
+        Returns the standard errors of the coefficients of every fitted model.
+
+        :return: array (n_coef, n_responses)
+        """
+        if self._results:
+            return self._results.se
+        else:
+            raise ValueError('model not fitted')
+
+    def test_stats(self):
+        """
+        Returns the test statistics of the coefficients of every fitted
+        model.
+
+        :return: array (n_coef, n_responses)
+        """
+        if self._results:
+            return self._results.tval
+        else:
+            raise ValueError('model not fitted')
+
+    def p_value(self):
+        """
+        Returns the p-values of test of significance on the coefficients of
+        every fitted model.
+
+        :return: array (n_coef, n_responses)
+        """
+        if self._results:
+            return self._results.pval
+        else:
+            raise ValueError('model not fitted')
+
+    def df_residual(self):
+        """
+        Returns the degree of freedom on residuals, shared by all the models.
+
+        :return: an integer
+        """
+        if self._results:
+            return self._results.df_residual
+        else:
+            raise ValueError('model not fitted')
+
+    def residuals(self):
+        """
+        Returns the residuals on training data of every fitted model.
+
+        :return: array (n_samples, n_responses)
+        """
+        if self._results:
+            return self._results.residuals
+        else:
+            raise ValueError('model not fitted')
+
+    def fitted_values(self):
+        """
+        Returns the fitted values on training data of every fitted model.
+
+        :return: array (n_samples, n_responses)
+        """
+        if self._results:
+            return self._results.fitted_values
+        else:
+            raise ValueError('model not fitted')
+
+    def r_squared(self):
+        """
+        Returns R squared of every fitted model.
+
+        :return: array (n_responses,)
+        """
+        if self._results:
+            return self._results.r_squared
+        else:
+            raise ValueError('model not fitted')
+
+    def residual_se(self):
+        """
+        Returns the residual standard error of every fitted model.
+
+        :return: array (n_responses,)
+        """
+        if self._results:
+            return self._results.sigma
+        else:
+            raise ValueError('model not fitted')
+
+    def predict(self, X_test):
+        """
+        Takes feature vectors with the same features as training data and
+        returns predictions of every fitted model at once.
+
+        :param X_test: feature vectors, array-like or Pandas Dataframe with
+        the same features as the training data
+        :return: array (n_samples, n_responses)
+        """
+        if self._results:
+            data = LM._columns(X_test, self._features)
+            X_design = self._design.build(data, len(X_test))
+            return X_design[:, self._results.columns] @ self._results.coef
+        else:
+            raise ValueError('model not fitted')
@@ -11,12 +11,8 @@ extra information for the rest retrieved from the R object.
 """
 
 import pandas as pd
-from rpy2.robjects import pandas2ri
-from rpy2.robjects.packages import importr
 
-pandas2ri.activate()
-base = importr('base')
-stats = importr('stats')
+from simplerpy._session import R
 
 
 class tTest:
@@ -45,6 +41,8 @@ class tTest:
 
         :return: None, assign to self._model
         """
+        base = R.package('base')
+        stats = R.package('stats')
         if isinstance(data_a, pd.Series):
             dataA = data_a
         else:
@@ -12,11 +12,13 @@ Test suite for the class AOV in the package simplerpy
 import math
 import unittest
 
+import numpy as np
 import pandas as pd
 from rpy2 import robjects as ro
 from rpy2.robjects import Formula
 from rpy2.robjects import pandas2ri
 
+from simplerpy._tukey import ptukey, qtukey
 from simplerpy.aov import AOV
 
 pandas2ri.activate()
@@ -36,6 +38,15 @@ class AOVTestCase(unittest.TestCase):
                            'y': [678000, 888000, 682000, 1600000, 750000,
                                  682000, 896000, 425000, 911000]})
 
+        d2 = pd.DataFrame({'g': ['a', 'b', 'c', 'a', 'b', 'c', 'a', 'b',
+                                 'c', 'a', 'b', 'c'],
+                           'h': ['u', 'u', 'v', 'v', 'u', 'v', 'u', 'v',
+                                 'u', 'v', 'v', 'u'],
+                           'x': [1, 3, 2, 5, 4, 6, 8, 7, 9, 3, 2, 4],
+                           'y': [3, 4, 2, 6, 8, 5, 9, 8, 7, 4, 5, 3]})
+        self.d1 = d1
+        self.d2 = d2
+
         self.M1R = R.aov(Formula('y~x1+x2+x3+x4'), d1)
         self.M1P = AOV()
         self.M1P.fit('y~x1+x2+x3+x4', d1)
@@ -60,14 +71,14 @@ class AOVTestCase(unittest.TestCase):
     def test_SSResid(self):
         r = sum(list(map(lambda x: pow(x, 2), self.M1R.rx2('residuals'))))
         p = self.M1P.sum_of_squares_res()
-        self.assertEqual(r, p)
+        self.assertAlmostEqual(r, p, delta=abs(r) * 1e-12)
 
     def test_RSE(self):
         SSResid = sum(list(map(lambda x: pow(x, 2), self.M1R.rx2('residuals'))))
         df_resid = self.M1R.rx2('df.residual')[0]
         r = math.sqrt(SSResid / df_resid)
         p = self.M1P.residual_se()
-        self.assertEqual(r, p)
+        self.assertAlmostEqual(r, p, delta=abs(r) * 1e-12)
 
     def test_r_obj(self):
         r = self.M1R
@@ -84,3 +95,238 @@ class AOVTestCase(unittest.TestCase):
             "Estimated effects may be unbalanced"
         p = self.M1P.summary()
         self.assertEqual(r, p)
+
+    def test_absorb(self):
+        d2 = pd.DataFrame({'g': ['a', 'b', 'c', 'a', 'b', 'c', 'a', 'b',
+                                 'c', 'a'],
+                           'x1': [1, 3, 2, 5, 4, 6, 8, 7, 9, 3],
+                           'x2': [2, 1, 2, 3, 5, 4, 3, 6, 5, 1],
+                           'y': [3, 4, 2, 6, 8, 5, 9, 8, 7, 4]})
+        r = R.summary(R.aov(Formula('y~g+x1+x2'), d2))[0]
+        p = AOV()
+        p.fit('y~x1+x2', d2, absorb=['g'], engine='numpy')
+        self.assertEqual(list(r['Df'])[1:-1], p.df())
+        self.assertEqual(r['Df'][-1], p.df_residual())
+        for expected, actual in zip(list(r['Sum Sq'])[1:-1],
+                                    p.sum_of_squares()):
+            self.assertAlmostEqual(expected, actual, places=8)
+        self.assertAlmostEqual(r['Sum Sq'][-1], p.sum_of_squares_res(),
+                               places=8)
+        self.assertIsNone(p.r_model_obj())
+        # like LM, absorbing effects needs the numpy engine
+        self.assertRaises(ValueError, p.fit, 'y~x1+x2', d2, absorb=['g'])
+
+    def test_numpy_engine(self):
+        p = AOV()
+        p.fit('y~x1+x2+x3+x4', self.d1, engine='numpy')
+        self.assertEqual(self.M1P.df(), p.df())
+        self.assertEqual(self.M1P.df_residual(), p.df_residual())
+        for expected, actual in zip(self.M1P.sum_of_squares(),
+                                    p.sum_of_squares()):
+            self.assertAlmostEqual(expected, actual, delta=expected * 1e-10)
+        self.assertAlmostEqual(self.M1P.residual_se(), p.residual_se(),
+                               delta=p.residual_se() * 1e-10)
+        self.assertEqual(self.M1P.summary(), p.summary())
+        self.assertIsNone(p.r_model_obj())
+
+    def test_numpy_factors(self):
+        r = R.summary(R.aov(Formula('y~g*h+x'), self.d2))[0]
+        p = AOV()
+        p.fit('y~g*h+x', self.d2, engine='numpy')
+        self.assertEqual(list(r['Df'])[:-1], p.df())
+        self.assertEqual(r['Df'][-1], p.df_residual())
+        for expected, actual in zip(list(r['Sum Sq'])[:-1],
+                                    p.sum_of_squares()):
+            self.assertAlmostEqual(expected, actual, places=8)
+
+    def test_numpy_missing(self):
+        d1 = self.d1.astype(float)
+        d1.loc[2, 'y'] = np.nan
+        d1.loc[5, 'x3'] = np.nan
+        # aov() drops the incomplete rows
+        r = R.summary(R.aov(Formula('y~x1+x3'), d1))[0]
+        p = AOV()
+        p.fit('y~x1+x3', d1, engine='numpy')
+        self.assertEqual(r['Df'][-1], p.df_residual())
+        for expected, actual in zip(list(r['Sum Sq']), p.table().sum_sq):
+            self.assertAlmostEqual(expected, actual, delta=expected * 1e-10)
+        table = AOV.fit_many('x1+x3', d1.assign(y2=d1['x2']), ['y', 'y2'])
+        np.testing.assert_allclose(p.table().sum_sq,
+                                   table.sum_sq[table.response == 'y'])
+
+    def test_numpy_empty_cells(self):
+        # a factorial design with a third of its cells empty, whose
+        # interaction has many aliased columns
+        rng = np.random.default_rng(0)
+        a = rng.integers(0, 8, 400)
+        b = rng.integers(0, 8, 400)
+        full = ~np.isin(a * 8 + b, rng.choice(64, 20, replace=False))
+        d = pd.DataFrame({'a': [f'a{i}' for i in a[full]],
+                          'b': [f'b{i}' for i in b[full]]})
+        d['y'] = rng.normal(size=len(d))
+        r = R.summary(R.aov(Formula('y~a*b'), d))[0]
+        p = AOV()
+        p.fit('y~a*b', d, engine='numpy')
+        self.assertEqual(list(r['Df'])[:-1], p.df())
+        self.assertEqual(r['Df'][-1], p.df_residual())
+        for expected, actual in zip(list(r['Sum Sq']),
+                                    p.table().sum_sq):
+            self.assertAlmostEqual(expected, actual, places=8)
+
+    def test_ss_types(self):
+        def rss(formula):
+            return R.deviance(R.lm(formula, data=self.d2))[0]
+
+        p = AOV()
+        p.fit('y~g*h+x', self.d2, engine='numpy', ss_type=2)
+        full = rss('y~g*h+x')
+        expected = [rss('y~h+x') - rss('y~g+h+x'),
+                    rss('y~g+x') - rss('y~g+h+x'),
+                    rss('y~g+h+g:h') - full, rss('y~g+h+x') - full]
+        for e, a in zip(expected, p.sum_of_squares()):
+            self.assertAlmostEqual(e, a, places=8)
+
+        # type 3 drops the sum to zero coded columns of every term in turn
+        g = pd.get_dummies(self.d2['g']).to_numpy(dtype=float)
+        g = g[:, :-1] - g[:, -1:]
+        h = pd.get_dummies(self.d2['h']).to_numpy(dtype=float)
+        h = h[:, :-1] - h[:, -1:]
+        blocks = [g, h, self.d2[['x']].to_numpy(dtype=float), g * h]
+        y = self.d2['y'].to_numpy(dtype=float)
+
+        def lstsq_rss(columns):
+            X = np.column_stack([np.ones(len(y))] + columns)
+            e = y - X @ np.linalg.lstsq(X, y, rcond=None)[0]
+            return e @ e
+
+        p.fit('y~g*h+x', self.d2, engine='numpy', ss_type=3)
+        for i, actual in enumerate(p.sum_of_squares()):
+            self.assertAlmostEqual(
+                lstsq_rss(blocks[:i] + blocks[i + 1:]) - full, actual,
+                places=8)
+        self.assertAlmostEqual(full, p.sum_of_squares_res(), places=8)
+
+    def test_ss_types_handling(self):
+        p = AOV()
+        self.assertRaises(ValueError, p.fit, 'y~x1', self.d1, ss_type=2)
+        self.assertRaises(ValueError, p.fit, 'y~x1', self.d1,
+                          engine='numpy', ss_type=4)
+        self.assertRaises(ValueError, p.fit, 'y~x1', self.d1, engine='sas')
+
+    def test_table(self):
+        r = R.summary(self.M1R)[0]
+        for p in (self.M1P, AOV()):
+            if p.r_model_obj() is None:
+                p.fit('y~x1+x2+x3+x4', self.d1, engine='numpy')
+            table = p.table()
+            self.assertFalse(table.flags.writeable)
+            self.assertEqual(['x1', 'x2', 'x3', 'x4', 'Residuals'],
+                             table.term.tolist())
+            np.testing.assert_allclose(r['Mean Sq'], table.mean_sq,
+                                       rtol=1e-10)
+            np.testing.assert_allclose(r['F value'], table.f_value,
+                                       rtol=1e-10)
+            np.testing.assert_allclose(r['Pr(>F)'], table.p_value,
+                                       rtol=1e-10)
+        self.assertRaises(ValueError, AOV().summary)
+
+    def test_fit_many(self):
+        d = self.d2.assign(z=self.d2['y'] * 2 + self.d2['x'])
+        table = AOV.fit_many('g*h+x', d, ['y', 'z'])
+        self.assertFalse(table.flags.writeable)
+        for response in ('y', 'z'):
+            r = R.summary(R.aov(Formula(f'{response}~g*h+x'), d))[0]
+            rows = table[table.response == response]
+            self.assertEqual(['g', 'h', 'x', 'g:h', 'Residuals'],
+                             rows.term.tolist())
+            np.testing.assert_allclose(r['Df'], rows.df)
+            np.testing.assert_allclose(r['Sum Sq'], rows.sum_sq, rtol=1e-10)
+            np.testing.assert_allclose(r['F value'], rows.f_value,
+                                       rtol=1e-10)
+            np.testing.assert_allclose(r['Pr(>F)'], rows.p_value,
+                                       rtol=1e-10)
+        self.assertRaises(ValueError, AOV.fit_many, 'g', d, ['w'])
+
+    def test_from_stream(self):
+        r = R.summary(R.aov(Formula('y~g'), self.d2))[0]
+        chunks = (self.d2.iloc[i:i + 5] for i in range(0, 12, 5))
+        p = AOV.from_stream(chunks, group='g', value='y')
+        self.assertEqual(list(r['Df'])[:-1], p.df())
+        self.assertEqual(r['Df'][-1], p.df_residual())
+        np.testing.assert_allclose(r['Sum Sq'], p.table().sum_sq, rtol=1e-10)
+        np.testing.assert_allclose(r['F value'], p.table().f_value,
+                                   rtol=1e-10)
+        self.assertAlmostEqual(math.sqrt(r['Mean Sq'][-1]), p.residual_se(),
+                               places=10)
+        self.assertIsNone(p.r_model_obj())
+        self.assertRaises(ValueError, AOV.from_stream, [self.d2], 'g', 'w')
+        self.assertRaises(ValueError, AOV.from_stream,
+                          [self.d2[self.d2['g'] == 'a']], 'g', 'y')
+
+    def test_permutation_test(self):
+        p = AOV()
+        p.fit('y~g*h+x', self.d2)
+        result = p.permutation_test(n_perm=200, random_state=0,
+                                    batch_size=64)
+        self.assertFalse(result.flags.writeable)
+        self.assertEqual(['g', 'h', 'x', 'g:h'], result.term.tolist())
+        np.testing.assert_allclose(p.table().f_value[:-1], result.f_value)
+
+        # the same permutations applied one at a time
+        y = self.d2['y'].to_numpy()
+        exceed = np.zeros(4)
+        for seed in np.random.SeedSequence(0).spawn(200):
+            permuted = self.d2.assign(y=y[np.random.default_rng(
+                seed).permutation(len(y))])
+            q = AOV()
+            q.fit('y~g*h+x', permuted, engine='numpy')
+            exceed += q.table().f_value[:-1] >= \
+                result.f_value * (1 - 1e-8)
+        np.testing.assert_allclose((exceed + 1) / 201, result.p_value)
+        np.testing.assert_array_equal(
+            result.p_value,
+            p.permutation_test(n_perm=200, random_state=0,
+                               n_jobs=2).p_value)
+        self.assertRaises(ValueError, AOV().permutation_test)
+
+        # the data kept at fit time do not follow the data frame
+        d2 = self.d2.copy()
+        p.fit('y~g*h+x', d2)
+        d2['y'] = 0.0
+        np.testing.assert_array_equal(
+            result.p_value,
+            p.permutation_test(n_perm=200, random_state=0).p_value)
+        stream = AOV.from_stream([self.d2], 'g', 'y')
+        self.assertRaises(ValueError, stream.permutation_test)
+
+    def test_tukey_hsd(self):
+        # the last two are unbalanced, with projected means of g
+        for formula, data in (('y~g', self.d2), ('y~g+h', self.d2),
+                              ('y~h+g', self.d2.iloc[:10]),
+                              ('y~x+g', self.d2)):
+            r = np.asarray(R.TukeyHSD(R.aov(Formula(formula), data),
+                                      'g', **{'conf.level': 0.9})[0])
+            p = AOV()
+            p.fit(formula, data)
+            result = p.tukey_hsd('g', conf_level=0.9)
+            self.assertFalse(result.flags.writeable)
+            self.assertEqual(['b-a', 'c-a', 'c-b'],
+                             result.comparison.tolist())
+            np.testing.assert_allclose(
+                r, np.column_stack([result.diff, result.lwr, result.upr,
+                                    result.p_adj]), rtol=1e-6)
+        stream = AOV.from_stream([self.d2.iloc[:5], self.d2.iloc[5:]], 'g',
+                                 'y')
+        p.fit('y~g+x', self.d2, engine='numpy')
+        np.testing.assert_allclose(p.tukey_hsd('g').diff,
+                                   stream.tukey_hsd('g').diff)
+        self.assertRaises(ValueError, p.tukey_hsd, 'x')
+        self.assertRaises(ValueError, p.tukey_hsd, 'h')
+
+    def test_ptukey(self):
+        q = np.array([0.5, 2, 3.5, 6])
+        for nmeans, df in ((2, 2), (5, 30), (20, 900), (200, 30000)):
+            np.testing.assert_allclose(R.ptukey(q, nmeans, df),
+                                       ptukey(q, nmeans, df), rtol=1e-10)
+            self.assertAlmostEqual(R.qtukey(0.95, nmeans, df)[0],
+                                   qtukey(0.95, nmeans, df), places=10)
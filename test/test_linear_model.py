@@ -9,15 +9,20 @@
 Test suite for the class LM in the package simplerpy
 """
 
+import subprocess
+import sys
 import unittest
+from unittest import mock
 
 import numpy as np
 import pandas as pd
 from rpy2 import robjects
 from rpy2 import robjects as ro
 from rpy2.robjects import pandas2ri
+from scipy import sparse
 
-from simplerpy.linear_model import LM
+from simplerpy._sparse import sparse_fit
+from simplerpy.linear_model import LM, MultiLM
 
 pandas2ri.activate()
 R = ro.r
@@ -49,6 +54,12 @@ class LMTestCase(unittest.TestCase):
         self.M2P = LM()
         self.M2P.fit(dataset2_x, dataset2_y,  verbose=0)
 
+        self.M1N = LM()
+        self.M1N.fit(x_train, y_train, verbose=0, engine='numpy')
+
+        self.M2N = LM()
+        self.M2N.fit(dataset2_x, dataset2_y, verbose=0, engine='numpy')
+
         self.ds1 = dataset1
         self.ds2x = dataset2_x
         self.ds2y = dataset2_y
@@ -144,9 +155,16 @@ class LMTestCase(unittest.TestCase):
 
     def test_lm_residual(self):
         R_resi = self.M1R.rx('residuals')[0]
-        P_resi = self.M1P.residuals()
+        P_resi = self.M1P.residuals(as_list=True)
         self.assertEqual(R_resi.tolist(), P_resi)
 
+    def test_lm_residual_array(self):
+        R_resi = self.M1R.rx('residuals')[0]
+        P_resi = self.M1P.residuals()
+        self.assertIsInstance(P_resi, np.ndarray)
+        self.assertFalse(P_resi.flags.writeable)
+        np.testing.assert_array_equal(R_resi, P_resi)
+
     def test_lm_df_residual(self):
         R_dfr = self.M1R.rx('df.residual')[0][0]
         P_dfr = self.M1P.df_residual()
@@ -161,7 +179,45 @@ class LMTestCase(unittest.TestCase):
         X_new = pd.DataFrame({'x1': [2], 'x2': [3], 'x3': [4], 'x4': [5]})
         R_y = R.predict(self.M1R, X_new)
         P_y = self.M1P.predict(X_new)
-        self.assertEqual(R_y, P_y)
+        np.testing.assert_allclose(R_y, P_y, rtol=1e-12)
+
+    def test_predict_interval(self):
+        X_new = pd.DataFrame({'x1': [2, 6], 'x2': [3, 1], 'x3': [4, 0],
+                              'x4': [5, 6]})
+        for interval in ('confidence', 'prediction'):
+            R_y = R.predict(self.M1R, X_new, interval=interval, level=0.9)
+            np.testing.assert_allclose(
+                R_y, self.M1P.predict(X_new, interval=interval, level=0.9),
+                rtol=1e-10)
+            np.testing.assert_allclose(
+                R_y, self.M1N.predict(X_new, interval=interval, level=0.9),
+                rtol=1e-10)
+
+    def test_predict_chunks(self):
+        X_new = pd.DataFrame({'x1': [2, 6, 1], 'x2': [3, 1, 1],
+                              'x3': [4, 0, 1], 'x4': [5, 6, 7]})
+        expected = self.M1N.predict(X_new)
+        np.testing.assert_allclose(expected,
+                                   self.M1N.predict(X_new, chunk_size=2))
+        chunks = (X_new.iloc[i:i + 1] for i in range(3))
+        np.testing.assert_allclose(expected, self.M1N.predict(chunks))
+        self.assertEqual((0,), self.M1N.predict(X_new.iloc[:0]).shape)
+        self.assertEqual((0, 3), self.M1P.predict(
+            X_new.iloc[:0], interval='confidence').shape)
+
+    def test_predict_factors(self):
+        df = pd.DataFrame({'g': ['a', 'b', 'c', 'a', 'b', 'c', 'a'],
+                           'x1': [1, 3, 2, 5, 4, 6, 8],
+                           'y': [3, 4, 2, 6, 8, 5, 9]})
+        model = LM()
+        model.fit(df[['g', 'x1']], df['y'], verbose=0)
+        # the levels are those of the training data, not of the new data
+        X_new = pd.DataFrame({'g': ['c', 'a'], 'x1': [2, 7]})
+        np.testing.assert_allclose(R.predict(model.r_model_obj(), X_new),
+                                   model.predict(X_new), rtol=1e-10)
+        # an unseen level is an error in R as well
+        self.assertRaises(Exception, model.predict,
+                          pd.DataFrame({'g': ['d'], 'x1': [1]}))
 
     def test_test_stats(self):
         R_stats = [result[2] for result in R.summary(self.M1R).rx('coefficients')[0]]
@@ -175,8 +231,9 @@ class LMTestCase(unittest.TestCase):
 
     def test_fitted_values(self):
         R_fv = self.M1R.rx('fitted.values')[0]
-        P_fv = self.M1P.fitted_values()
+        P_fv = self.M1P.fitted_values(as_list=True)
         self.assertEqual(R_fv.tolist(), P_fv)
+        np.testing.assert_array_equal(R_fv, self.M1P.fitted_values())
 
     def test_r_squared(self):
         R_rs = R.summary(self.M1R).rx('r.squared')[0][0]
@@ -202,6 +259,452 @@ class LMTestCase(unittest.TestCase):
         P_rse = self.M1P.residual_se()
         self.assertEqual(R_rse, P_rse)
 
+    def test_import_does_not_start_r(self):
+        code = 'import sys, simplerpy.linear_model, simplerpy.aov, ' \
+               'simplerpy.t_test; print("rpy2.robjects" in sys.modules)'
+        out = subprocess.run([sys.executable, '-c', code], check=True,
+                             capture_output=True, text=True).stdout
+        self.assertEqual(out.strip(), 'False')
+
+    def test_accessors_use_cached_results(self):
+        with mock.patch('simplerpy.linear_model.R') as r:
+            self.M1P.coefficient()
+            self.M1P.standard_error()
+            self.M1P.test_stats()
+            self.M1P.p_value()
+            self.M1P.r_squared()
+            self.M1P.adj_r_squared()
+            self.M1P.f_test_pvalue()
+            self.M1P.residual_se()
+            self.M1P.summary()
+        r.summary.assert_not_called()
+
+    def test_numpy_engine_coefficient(self):
+        for r_model, p_model in ((self.M1R, self.M1N), (self.M2R, self.M2N)):
+            R_coef = R.summary(r_model).rx2('coefficients')
+            np.testing.assert_allclose(R_coef[:, 0], p_model.coefficient(),
+                                       rtol=1e-10)
+            np.testing.assert_allclose(R_coef[:, 1],
+                                       p_model.standard_error(), rtol=1e-10)
+            np.testing.assert_allclose(R_coef[:, 2], p_model.test_stats(),
+                                       rtol=1e-10)
+            np.testing.assert_allclose(R_coef[:, 3], p_model.p_value(),
+                                       rtol=1e-8)
+
+    def test_numpy_engine_fit_statistics(self):
+        summ = R.summary(self.M1R)
+        self.assertAlmostEqual(summ.rx2('r.squared')[0],
+                               self.M1N.r_squared(), places=12)
+        self.assertAlmostEqual(summ.rx2('adj.r.squared')[0],
+                               self.M1N.adj_r_squared(), places=12)
+        self.assertAlmostEqual(summ.rx2('sigma')[0], self.M1N.residual_se(),
+                               places=12)
+        np.testing.assert_allclose(summ.rx2('fstatistic'),
+                                   self.M1N.f_statistic(), rtol=1e-10)
+        self.assertEqual(self.M1R.rx2('df.residual')[0],
+                         self.M1N.df_residual())
+
+    def test_numpy_engine_residuals(self):
+        np.testing.assert_allclose(self.M1R.rx2('residuals'),
+                                   self.M1N.residuals(), atol=1e-12)
+        np.testing.assert_allclose(self.M1R.rx2('fitted.values'),
+                                   self.M1N.fitted_values(), atol=1e-12)
+
+    def test_numpy_engine_with_formula(self):
+        M1 = R.lm('y~x1+x3-1', data=self.ds1)
+        R_coef = [result[0] for result in R.summary(M1).rx('coefficients')[0]]
+        model = LM()
+        x_train = self.ds1.drop(columns=['y'])
+        model.fit(x_train, self.ds1['y'], formula='y~x1+x3-1', verbose=0,
+                  engine='numpy')
+        np.testing.assert_allclose(R_coef, model.coefficient(), rtol=1e-10)
+
+    def test_numpy_engine_factors_without_intercept(self):
+        df = pd.DataFrame({'g': ['a', 'b', 'c', 'a', 'b', 'c', 'a', 'b'],
+                           'h': ['p', 'q', 'p', 'q', 'p', 'q', 'p', 'q'],
+                           'x1': [1, 3, 2, 5, 4, 6, 8, 7],
+                           'y': [3, 4, 2, 6, 8, 5, 9, 8]})
+        for formula in ('y~g+h-1', 'y~x1+g*h-1'):
+            M1 = R.lm(formula, data=df)
+            model = LM()
+            model.fit(df[['g', 'h', 'x1']], df['y'], formula=formula,
+                      verbose=0, engine='numpy')
+            coef = R.coef(M1)
+            # the first factor alone is coded by indicators, as in R
+            self.assertEqual(list(coef.names),
+                             list(model._results.names))
+            np.testing.assert_allclose(np.asarray(coef),
+                                       model.coefficient(), rtol=1e-10)
+
+    def test_numpy_engine_missing(self):
+        df = pd.DataFrame({'g': ['a', 'b', 'c', 'a', 'b', 'c', 'a', 'b'],
+                           'x1': [1, 3, 2, np.nan, 4, 6, 8, 7],
+                           'y': [3, 4, 2, 6, np.nan, 5, 9, 8]})
+        # lm() drops the incomplete rows
+        M1 = R.lm('y~g+x1', data=df)
+        model = LM()
+        model.fit(df[['g', 'x1']], df['y'], verbose=0, engine='numpy')
+        np.testing.assert_allclose(np.asarray(R.coef(M1)),
+                                   model.coefficient(), rtol=1e-10)
+        self.assertEqual(M1.rx2('df.residual')[0], model.df_residual())
+        np.testing.assert_allclose(M1.rx2('residuals'), model.residuals(),
+                                   atol=1e-12)
+
+    def test_numpy_engine_summary(self):
+        self.assertEqual(self.M1P.summary(), self.M1N.summary())
+
+    def test_numpy_engine_handling(self):
+        self.assertRaises(ValueError, self.M1N.r_model_obj)
+        self.assertRaises(ValueError, LM().fit, self.ds2x, self.ds2y,
+                          formula='y~log(f1)', engine='numpy')
+        self.assertRaises(ValueError, LM().fit, self.ds2x, self.ds2y,
+                          engine='julia')
+
+    def test_partial_fit(self):
+        model = LM()
+        x_train = self.ds1.drop(columns=['y'])
+        for rows in (slice(0, 2), slice(2, 3), slice(3, 5)):
+            model.partial_fit(x_train[rows], self.ds1['y'][rows])
+        model.finalize()
+        R_coef = R.summary(self.M1R).rx2('coefficients')
+        np.testing.assert_allclose(R_coef, np.column_stack(
+            [model.coefficient(), model.standard_error(),
+             model.test_stats(), model.p_value()]), rtol=1e-8)
+        self.assertAlmostEqual(self.M1P.r_squared(), model.r_squared(),
+                               places=10)
+        np.testing.assert_allclose(self.M1P.f_statistic(),
+                                   model.f_statistic(), rtol=1e-8)
+        self.assertRaises(ValueError, model.residuals)
+
+    def test_fit_n_jobs(self):
+        model = LM()
+        x_train = self.ds1.drop(columns=['y'])
+        model.fit(x_train, self.ds1['y'], verbose=0, engine='numpy',
+                  n_jobs=2)
+        R_coef = R.summary(self.M1R).rx2('coefficients')
+        np.testing.assert_allclose(R_coef[:, :3], np.column_stack(
+            [model.coefficient(), model.standard_error(),
+             model.test_stats()]), rtol=1e-8)
+        np.testing.assert_allclose(self.M1R.rx2('residuals'),
+                                   model.residuals(), atol=1e-10)
+        self.assertRaises(ValueError, LM().fit, x_train, self.ds1['y'],
+                          n_jobs=2)
+
+    def test_fit_groups(self):
+        df = pd.DataFrame({'g': ['a', 'b', 'a', 'b', 'a', 'b', 'a', 'b'],
+                           'x1': [1, 2, 3, 4, 5, 6, 7, 8],
+                           'x2': [2, 1, 0, 1, 4, 3, 2, 9],
+                           'y': [2, 1, 3, 5, 4, 8, 6, 7]})
+        table = LM.fit_groups(df, 'g', 'y ~ x1 + x2', n_jobs=2,
+                              batch_size=1)
+        self.assertEqual(table['n'].tolist(), [4, 4])
+        for key in ('a', 'b'):
+            summ = R.summary(R.lm('y~x1+x2', data=df[df['g'] == key]))
+            coef = summ.rx2('coefficients')
+            np.testing.assert_allclose(coef[:, 0],
+                                       table.loc[key, 'coefficient'],
+                                       rtol=1e-10)
+            np.testing.assert_allclose(coef[:, 1],
+                                       table.loc[key, 'standard_error'],
+                                       rtol=1e-10)
+            self.assertAlmostEqual(summ.rx2('r.squared')[0],
+                                   table.loc[key, 'r_squared'].item(),
+                                   places=12)
+
+    def test_rolling_fit(self):
+        df = pd.DataFrame({'x1': [1, 2, 3, 4, 5, 6, 7, 8],
+                           'x2': [2, 1, 0, 0, 0, 0, 0, 9],
+                           'y': [2, 1, 3, 5, 4, 8, 6, 7]},
+                          index=pd.date_range('2022-03-01', periods=8))
+        table = LM.rolling_fit(df[['x1', 'x2']], df['y'], window=4, step=1)
+        self.assertEqual(table.index.tolist(), df.index[3:].tolist())
+        for end in range(3, 8):
+            fit = R.lm('y~x1+x2', data=df[end - 3:end + 1])
+            summ = R.summary(fit)
+            coef = R.coef(summ)
+            aliased = np.isnan(R.coef(fit))
+            row = table.loc[df.index[end]]
+            self.assertTrue(row['coefficient'][aliased].isna().all())
+            np.testing.assert_allclose(coef[:, 0],
+                                       row['coefficient'][~aliased],
+                                       rtol=1e-10, atol=1e-10)
+            np.testing.assert_allclose(coef[:, 1],
+                                       row['standard_error'][~aliased],
+                                       rtol=1e-10)
+            self.assertAlmostEqual(summ.rx2('r.squared')[0],
+                                   row['r_squared'].item(), places=10)
+        table = LM.rolling_fit(self.ds2x, self.ds2y, window=2, step=2,
+                               formula='~f1')
+        self.assertEqual(table.index.tolist(), [1, 3])
+        self.assertRaises(ValueError, LM.rolling_fit, self.ds2x, self.ds2y,
+                          window=0)
+
+    def test_influence(self):
+        df = pd.DataFrame({'x1': [1, 2, 3, 4, 5, 7],
+                           'x3': [1, 0, 0, 1, 1, 0],
+                           'y': [2, 1, 3, 5, 4, 3]})
+        fit = R.lm('y~x1+x3', data=df)
+        for engine in ('r', 'numpy'):
+            model = LM()
+            model.fit(df[['x1', 'x3']], df['y'], verbose=0, engine=engine)
+            result = model.influence()
+            np.testing.assert_allclose(R.hatvalues(fit), result.hat,
+                                       rtol=1e-10)
+            np.testing.assert_allclose(R.rstudent(fit), result.rstudent,
+                                       rtol=1e-10)
+            np.testing.assert_allclose(R('cooks.distance')(fit),
+                                       result.cooks_distance, rtol=1e-10)
+            np.testing.assert_allclose(R.dffits(fit), result.dffits,
+                                       rtol=1e-10)
+            np.testing.assert_allclose(
+                np.asarray(R.residuals(fit)) / (1 - R.hatvalues(fit)),
+                result.press, rtol=1e-10)
+
+    def test_influence_handling(self):
+        self.assertRaises(ValueError, self.empty.influence)
+        model = LM()
+        model.partial_fit(self.ds2x, self.ds2y)
+        model.finalize()
+        self.assertRaises(ValueError, model.influence)
+
+    def test_cross_validate(self):
+        x_train = self.ds1[['x1', 'x3']]
+        errors = LM.cross_validate(x_train, self.ds1['y'], k=5,
+                                   random_state=1)
+        self.assertEqual(len(errors), 5)
+        # leave-one-out errors are the squared prediction residuals
+        model = LM()
+        model.fit(x_train, self.ds1['y'], verbose=0)
+        np.testing.assert_allclose(np.sort(model.influence().press ** 2),
+                                   np.sort(errors), rtol=1e-8)
+        np.testing.assert_allclose(
+            errors, LM.cross_validate(x_train, self.ds1['y'], k=5,
+                                      random_state=1, n_jobs=2,
+                                      batch_size=1), rtol=1e-12)
+        self.assertRaises(ValueError, LM.cross_validate, x_train,
+                          self.ds1['y'], k=6)
+
+    def test_bootstrap(self):
+        x_train = self.ds1.drop(columns=['y'])
+        table = LM.bootstrap(x_train, self.ds1['y'], n_boot=20,
+                             random_state=1)
+        self.assertEqual(table.shape, (20, 5))
+        self.assertEqual(table.columns.tolist(),
+                         ['(Intercept)', 'x1', 'x2', 'x3', 'x4'])
+        self.assertTrue(table[['x2', 'x4']].isna().all().all())
+        pd.testing.assert_frame_equal(
+            table, LM.bootstrap(x_train, self.ds1['y'], n_boot=20,
+                                random_state=1, n_jobs=2, batch_size=3))
+
+    def test_stepwise(self):
+        rng = np.random.default_rng(5)
+        df = pd.DataFrame(rng.normal(size=(60, 6)),
+                          columns=['x1', 'x2', 'x3', 'x4', 'x5', 'x6'])
+        df['y'] = df['x1'] + 0.3 * df['x2'] - 0.3 * df['x3'] + \
+            rng.normal(size=60)
+        step = R('function(d, k, s) attr(terms(step(lm(s, data=d), '
+                 'scope=y ~ x1 + x2 + x3 + x4 + x5 + x6, k=k, trace=0)), '
+                 '"term.labels")')
+        x_train = df.drop(columns=['y'])
+        for direction, start in (('both', 'y ~ .'), ('forward', 'y ~ 1')):
+            for criterion, k in (('aic', 2), ('bic', np.log(60))):
+                formula, model = LM.stepwise(x_train, df['y'],
+                                             direction=direction,
+                                             criterion=criterion)
+                R_terms = list(step(df, k, R.formula(start)))
+                # step() in R appends the terms in the order they are added
+                self.assertEqual(sorted(formula[4:].split(' + ')),
+                                 sorted(R_terms))
+                self.assertEqual(len(model.coefficient()), len(R_terms) + 1)
+
+    def test_stepwise_marginality(self):
+        rng = np.random.default_rng(7)
+        df = pd.DataFrame(rng.normal(size=(40, 2)), columns=['x1', 'x2'])
+        df['y'] = df['x1'] * df['x2'] + 0.1 * rng.normal(size=40)
+        for direction in ('both', 'backward'):
+            formula, _ = LM.stepwise(df[['x1', 'x2']], df['y'],
+                                     direction=direction,
+                                     formula='y ~ x1 * x2')
+            self.assertEqual(formula, 'y ~ x1 + x2 + x1:x2')
+        # the interaction can not enter before both main effects
+        formula, _ = LM.stepwise(df[['x1', 'x2']], df['y'],
+                                 direction='forward', formula='y ~ x1 * x2')
+        self.assertNotIn('x1:x2', formula)
+        self.assertRaises(ValueError, LM.stepwise, self.ds2x, self.ds2y,
+                          criterion='cp')
+
+    def test_stepwise_aliased(self):
+        rng = np.random.default_rng(3)
+        df = pd.DataFrame(rng.normal(size=(80, 3)), columns=['a', 'b', 'c'])
+        df['y'] = df['a'] + 0.8 * df['b'] + rng.normal(size=80)
+        # a constant and a duplicated candidate, aliased from the start
+        x_train = df[['a', 'b', 'c']].assign(k=1.0, d=df['a'])
+        for direction in ('both', 'backward', 'forward'):
+            formula, _ = LM.stepwise(x_train, df['y'], direction=direction)
+            self.assertEqual('y ~ a + b', formula)
+        step = R('function(d) attr(terms(step(lm(y ~ ., data=d), '
+                 'trace=0)), "term.labels")')
+        self.assertEqual(['a', 'b'],
+                         sorted(step(x_train.assign(y=df['y']))))
+
+    def test_ridge_path(self):
+        df = self.ds1.drop(columns=['x2', 'x4'])
+        df['x4'] = [1.1, 1.9, 3.2, 3.9, 5.1]
+        lambdas = np.array([0, 0.1, 1, 10])
+        path = LM.ridge_path(df[['x1', 'x3', 'x4']], df['y'], lambdas)
+        ridge = R('function(d, l) MASS::lm.ridge(y ~ x1 + x3 + x4, '
+                  'data=d, lambda=l)')(df, lambdas)
+        self.assertEqual(path.names, ('(Intercept)', 'x1', 'x3', 'x4'))
+        np.testing.assert_allclose(R.coef(ridge), path.coefficients,
+                                   rtol=1e-8)
+        np.testing.assert_allclose(ridge.rx2('GCV'), path.gcv, rtol=1e-8)
+        # without penalty the path is the least squares fit
+        model = LM()
+        model.fit(df[['x1', 'x3', 'x4']], df['y'], verbose=0)
+        np.testing.assert_allclose(model.coefficient(),
+                                   path.coefficients[0], rtol=1e-8)
+        self.assertAlmostEqual(path.df[0], 3)
+        self.assertTrue(np.all(np.diff(path.df) < 0))
+        # the penalties of the caller stay writeable and apart from the path
+        lambdas[0] = 5
+        self.assertEqual(0, path.lambdas[0])
+        self.assertFalse(path.lambdas.flags.writeable)
+        self.assertRaises(ValueError, LM.ridge_path, self.ds2x, self.ds2y,
+                          [-1])
+
+    def test_fit_absorb(self):
+        df = pd.DataFrame({'g': ['a', 'b', 'c', 'a', 'b', 'c', 'a', 'b',
+                                 'c', 'a'],
+                           'h': ['u', 'u', 'v', 'v', 'w', 'w', 'u', 'v',
+                                 'w', 'w'],
+                           'x1': [1, 3, 2, 5, 4, 6, 8, 7, 9, 3],
+                           'y': [3, 4, 2, 6, 8, 5, 9, 8, 7, 4]})
+        summ = R.summary(R.lm('y~x1+g+h', data=df))
+        model = LM()
+        model.fit(df[['g', 'h', 'x1']], df['y'], verbose=0, engine='numpy',
+                  absorb=['g', 'h'])
+        np.testing.assert_allclose(R.coef(summ)[1, :], np.column_stack(
+            [model.coefficient(), model.standard_error(),
+             model.test_stats(), model.p_value()])[0], rtol=1e-6)
+        self.assertEqual(summ.rx2('df')[1], model.df_residual())
+        np.testing.assert_allclose(R.residuals(R.lm('y~x1+g+h', data=df)),
+                                   model.residuals(), atol=1e-6)
+        self.assertRaises(ValueError, model.predict, df)
+        self.assertRaises(ValueError, LM().fit, df[['g', 'h', 'x1']],
+                          df['y'], absorb=['g'])
+
+    def test_fit_sparse(self):
+        x_train = self.ds1.drop(columns=['y'])
+        names = x_train.columns.tolist()
+        dense = LM()
+        dense.fit(x_train, self.ds1['y'], verbose=0, formula='y~x1+x3')
+        model = LM()
+        model.fit(sparse.csr_matrix(x_train.values), self.ds1['y'].values,
+                  feature_name=names, verbose=0, formula='y~x1+x3',
+                  engine='numpy')
+        np.testing.assert_allclose(dense.coefficient(), model.coefficient(),
+                                   rtol=1e-8)
+        np.testing.assert_allclose(dense.standard_error(),
+                                   model.standard_error(), rtol=1e-8)
+        np.testing.assert_allclose(
+            dense.predict(x_train, interval='confidence'),
+            model.predict(sparse.csc_matrix(x_train.values),
+                          interval='confidence'), rtol=1e-8)
+        # the sparse factorization gives the standard errors only
+        X = model._design.build_sparse(sparse.csr_matrix(x_train.values),
+                                       names)
+        results = sparse_fit(X, self.ds1['y'].values, model._design.names,
+                             True, dense_limit=1)
+        np.testing.assert_allclose(results.coef_table,
+                                   model._results.coef_table, rtol=1e-8)
+        self.assertIsNone(results.cov_unscaled)
+        self.assertRaises(ValueError, LM().fit,
+                          sparse.csr_matrix(x_train.values),
+                          self.ds1['y'].values)
+
+    def test_robust_standard_error(self):
+        X = np.column_stack([np.ones(5), self.ds1[['x1', 'x3']]])
+        bread = np.linalg.inv(X.T @ X)
+        hat = np.diag(X @ bread @ X.T)
+        groups = np.array(['a', 'b', 'a', 'b', 'c'])
+        for model in (self.M1P, self.M1N):
+            e = model.residuals()
+            weights = {'HC0': e ** 2, 'HC1': e ** 2 * 5 / 2,
+                       'HC2': e ** 2 / (1 - hat),
+                       'HC3': e ** 2 / (1 - hat) ** 2}
+            for kind, w in weights.items():
+                cov = bread @ X.T @ np.diag(w) @ X @ bread
+                np.testing.assert_allclose(np.sqrt(np.diag(cov)),
+                                           model.standard_error(kind),
+                                           rtol=1e-8)
+            sums = np.array([X[groups == g].T @ e[groups == g]
+                             for g in ('a', 'b', 'c')])
+            cov = bread @ sums.T @ sums @ bread * 3 / 2 * 4 / 2
+            np.testing.assert_allclose(
+                np.sqrt(np.diag(cov)),
+                model.standard_error('cluster', groups=groups), rtol=1e-8)
+        self.assertRaises(ValueError, self.M1N.standard_error, 'HC4')
+        self.assertRaises(ValueError, self.M1N.standard_error, 'cluster')
+        self.assertRaises(ValueError, self.M1N.standard_error, 'cluster',
+                          groups[:3])
+
+    def test_compare(self):
+        formulas = ['y~x1', 'y~x1+x3', 'y~x1+x3+x4']
+        expected = np.asarray(R.anova(*[R.lm(formula, data=self.ds1)
+                                        for formula in formulas]))
+        x_train = self.ds1.drop(columns=['y'])
+        models = []
+        for formula, engine in zip(formulas, ('r', 'numpy', 'r')):
+            model = LM()
+            model.fit(x_train, self.ds1['y'], formula=formula, verbose=0,
+                      engine=engine)
+            models.append(model)
+        for table in (LM.compare(*models),
+                      LM.compare(*formulas, X=x_train, y=self.ds1['y'])):
+            self.assertEqual(['Res.Df', 'RSS', 'Df', 'Sum of Sq', 'F',
+                              'Pr(>F)'], table.columns.tolist())
+            np.testing.assert_allclose(expected, table.values, rtol=1e-8,
+                                       atol=1e-10)
+
+    def test_compare_handling(self):
+        self.assertRaises(ValueError, LM.compare, self.M1N)
+        self.assertRaises(ValueError, LM.compare, self.M1N, self.empty)
+        self.assertRaises(ValueError, LM.compare, 'y~x1', 'y~x1+x3')
+        x_train = self.ds1.drop(columns=['y'])
+        self.assertRaises(ValueError, LM.compare, 'y~x1+x3', 'y~x1',
+                          X=x_train, y=self.ds1['y'])
+        other = LM()
+        other.fit(x_train, self.ds1['y'] * 2, verbose=0, engine='numpy')
+        self.assertRaises(ValueError, LM.compare, self.M1N, other)
+
+    def test_update_downdate(self):
+        x_train = self.ds1.drop(columns=['y'])
+        for engine in ('r', 'numpy'):
+            model = LM()
+            model.fit(x_train[:3], self.ds1['y'][:3], verbose=0,
+                      formula='y~x1+x3', engine=engine)
+            model.update(x_train[3:], self.ds1['y'][3:])
+            model.downdate(x_train[:1], self.ds1['y'][:1])
+            summ = R.summary(R.lm('y~x1+x3', data=self.ds1[1:]))
+            np.testing.assert_allclose(summ.rx2('coefficients'),
+                                       np.column_stack(
+                [model.coefficient(), model.standard_error(),
+                 model.test_stats(), model.p_value()]), rtol=1e-8)
+            self.assertAlmostEqual(summ.rx2('r.squared')[0],
+                                   model.r_squared(), places=10)
+            self.assertEqual(model.df_residual(), 1)
+            self.assertRaises(ValueError, model.residuals)
+            self.assertRaises(ValueError, model.r_model_obj)
+
+    def test_update_downdate_handling(self):
+        self.assertRaises(ValueError, self.empty.update, self.ds2x,
+                          self.ds2y)
+        self.assertRaises(ValueError, self.M2N.downdate, self.ds2x[:2],
+                          self.ds2y[:2])
+
+    def test_finalize_handling(self):
+        self.assertRaises(ValueError, self.empty.finalize)
+
     def test_summary(self):
         summary = self.M1P.summary()
         test_summary ='''$coefficients
@@ -214,3 +717,46 @@ Residual standard error: 1.070259 on 2 degrees of freedom
 Mutiple R-squared: 0.770909, Adjusted R-squared: 0.541818
 F-statistic: 3.365079 on 2.0 and 2.0 DF with p-value: 0.229091'''
         self.assertEqual(test_summary, summary)
+
+
+class MultiLMTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.X = pd.DataFrame({'x1': [1, 2, 3, 4, 5, 6],
+                               'x2': [1, 1, 1, 1, 1, 1],
+                               'x3': [1, 0, 0, 1, 1, 0]})
+        self.Y = pd.DataFrame({'y1': [2, 1, 3, 5, 4, 6],
+                               'y2': [9, 7, 8, 3, 4, 1],
+                               'y3': [0, 1, 0, 1, 1, 0]})
+        self.model = MultiLM()
+        self.model.fit(self.X, self.Y)
+        self.empty = MultiLM()
+
+    def test_coefficient_handling(self):
+        self.assertRaises(ValueError, self.empty.coefficient)
+
+    def test_predict_handling(self):
+        self.assertRaises(ValueError, self.empty.predict, self.X)
+
+    def test_matches_lm(self):
+        self.assertEqual(self.model.response_names(), ['y1', 'y2', 'y3'])
+        for j, response in enumerate(self.model.response_names()):
+            df = self.X.copy()
+            df[response] = self.Y[response]
+            summ = R.summary(R.lm(response + '~x1+x2+x3', data=df))
+            coef = summ.rx2('coefficients')
+            np.testing.assert_allclose(coef[:, 0],
+                                       self.model.coefficient()[:, j],
+                                       rtol=1e-10)
+            np.testing.assert_allclose(coef[:, 1],
+                                       self.model.standard_error()[:, j],
+                                       rtol=1e-10)
+            np.testing.assert_allclose(coef[:, 3],
+                                       self.model.p_value()[:, j],
+                                       rtol=1e-8)
+            self.assertAlmostEqual(summ.rx2('r.squared')[0],
+                                   self.model.r_squared()[j], places=12)
+
+    def test_predict(self):
+        np.testing.assert_allclose(self.model.predict(self.X),
+                                   self.model.fitted_values(), atol=1e-12)